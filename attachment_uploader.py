@@ -0,0 +1,101 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import ConnectionError, Timeout
+from metrics import metrics
+from config import qb_upload_config
+
+# QuickBooks error codes worth retrying: 3001 is ThrottleExceeded and 10000 is used
+# by the client for non-JSON or non-200 responses such as 429 and 5xx.
+TRANSIENT_ERROR_CODES = {3001, 10000}
+
+
+class AttachmentUploader:
+    """
+    Uploads journal report files to QuickBooks in the background.
+
+    Uploads start as soon as they are submitted and run with at most max_workers at
+    the same time, so reports can keep being generated and journal entries posted
+    while earlier files are still uploading. Transient failures are retried with an
+    exponential backoff.
+    """
+
+    def __init__(self, qb_api, max_workers=None):
+        self.qb_api = qb_api
+        self.max_attempts = qb_upload_config["max_attempts"]
+        self.backoff_seconds = qb_upload_config["backoff_seconds"]
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or qb_upload_config["max_workers"]
+        )
+        self.futures = []
+
+    def submit(self, file_path, journal_entry_id, label=None):
+        """Queues a file to be attached to a journal entry."""
+        future = self.executor.submit(self.upload, file_path, journal_entry_id, label)
+        self.futures.append(future)
+        return future
+
+    def wait(self):
+        """
+        Waits for every submitted upload and returns their results in submission order.
+
+        Each result is a dictionary with the file_path, journal_entry_id, label, ok,
+        attempts, seconds, bytes and error.
+        """
+        results = [future.result() for future in self.futures]
+        self.futures = []
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def upload(self, file_path, journal_entry_id, label=None):
+        """Attaches a file to a journal entry in the calling thread, see wait()."""
+        result = {
+            "file_path": file_path,
+            "journal_entry_id": journal_entry_id,
+            "label": label,
+            "ok": False,
+            "attempts": 0,
+            "seconds": 0.0,
+            "bytes": os.path.getsize(file_path) if os.path.exists(file_path) else 0,
+            "error": None,
+        }
+
+        start = time.perf_counter()
+        for attempt in range(1, self.max_attempts + 1):
+            result["attempts"] = attempt
+            try:
+                self.qb_api.upload_attachment(file_path, journal_entry_id)
+                result["ok"] = True
+                result["error"] = None
+                break
+            except Exception as e:
+                result["error"] = str(e)
+                if not self._is_transient(e) or attempt == self.max_attempts:
+                    break
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+        result["seconds"] = time.perf_counter() - start
+
+        if result["ok"]:
+            metrics.count("attachments", result="ok")
+            metrics.count("attachment_bytes", result["bytes"])
+            print(
+                f"Uploaded {os.path.basename(file_path)} ({result['bytes']} bytes) "
+                f"in {result['seconds']:.2f}s after {result['attempts']} attempt(s)"
+            )
+        else:
+            metrics.count("attachments", result="failed")
+            print(
+                f"Error while attaching file {file_path} to journal entry: {result['error']}"
+            )
+        return result
+
+    def _is_transient(self, error):
+        from quickbooks.exceptions import QuickbooksException
+
+        if isinstance(error, (ConnectionError, Timeout)):
+            return True
+        if isinstance(error, QuickbooksException):
+            return error.error_code in TRANSIENT_ERROR_CODES
+        return False
@@ -0,0 +1,207 @@
+"""
+End-to-end benchmark of the journal entry pipeline against local fake servers.
+
+Runs main.process_period, the same pipeline main() runs every day, against stand-ins
+of SellerCloud and QuickBooks and reports wall time, requests per second, peak RSS and
+the time spent in every stage. Each size runs in its own process so peak RSS is not
+shared between sizes.
+
+Usage, from the repository root:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --lines 1000 100000 --sc-latency 0.05
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_LINES = [1_000, 100_000, 1_000_000]
+CHANNELS = 3
+
+
+class FakeAuthClient:
+    """Already authenticated stand-in for intuitlib's AuthClient."""
+
+    client_id = "fake-client-id"
+    client_secret = "fake-client-secret"
+    environment = "sandbox"
+    access_token = "fake-access-token"
+    refresh_token = "fake-refresh-token"
+
+
+def run_single(args):
+    """Runs one benchmark size in this process and prints the result as JSON."""
+    from benchmarks.fake_servers import FakeQuickBooks, FakeSellerCloud
+
+    # The QuickBooks client refuses plain http without this
+    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+    os.chdir(tempfile.mkdtemp(prefix="qb_journal_bench_"))
+
+    lines_per_channel = args.single // CHANNELS
+    orders_per_channel = max(1, lines_per_channel // args.lines_per_order)
+    seller_cloud = FakeSellerCloud(
+        orders_per_channel,
+        lines_per_order=args.lines_per_order,
+        payload_bytes=args.payload_bytes,
+        latency=args.sc_latency,
+    ).start()
+    quick_books = FakeQuickBooks(latency=args.qb_latency).start()
+
+    import config
+
+    for endpoint in config.sellercloud_endpoints.values():
+        endpoint["url"] = endpoint["url"].replace(
+            config.sellercloud_base_url, f"{seller_cloud.url}/rest/api/"
+        )
+    for limits in config.sellercloud_rate_limits.values():
+        limits["requests_per_second"] = args.sc_rps
+        limits["burst"] = args.sc_rps
+    config.client_data["api_url"] = f"{quick_books.url}/v3"
+    config.order_cache_config["enabled"] = False
+    config.qb_ref_cache_config["persist"] = False
+    config.EMAIL_ENABLED = False
+
+    import main
+    from helpers import Helpers
+    from metrics import metrics
+    from qb_api import QbAPI
+    from seller_cloud_api import SellerCloudAPI
+
+    run_config = dict(main.run_config, post_in_batch=args.batch)
+    from_date, to_date = "07/01/2024 00:00:00", "07/01/2024 23:59:59"
+
+    metrics.reset()
+    start = time.perf_counter()
+    sc_api = SellerCloudAPI()
+    summary = main.process_period(
+        Helpers(),
+        sc_api,
+        lambda: QbAPI("fake-refresh-token", auth_client=FakeAuthClient()),
+        from_date,
+        to_date,
+        run_config,
+        notify=False,
+    )
+    wall = time.perf_counter() - start
+
+    seller_cloud.stop()
+    quick_books.stop()
+
+    requests = seller_cloud.requests + quick_books.requests
+    result = {
+        "lines": orders_per_channel * args.lines_per_order * CHANNELS,
+        "orders": orders_per_channel * CHANNELS,
+        "wall_seconds": round(wall, 3),
+        "requests": requests,
+        "requests_per_second": round(requests / wall, 1),
+        "sellercloud_requests": seller_cloud.requests,
+        "sellercloud_bytes": seller_cloud.bytes_sent,
+        "quickbooks_requests": quick_books.requests,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        # Stages running in several threads at once add up their time, so a stage
+        # can take longer than the wall time
+        "stage_seconds": {
+            stage: round(timing["seconds"], 3)
+            for stage, timing in metrics.stages().items()
+        },
+        "journals_created": len(summary["journals_created"]),
+    }
+    print(json.dumps(result))
+
+
+def run_all(args):
+    """Runs every size in its own process and prints a table of the results."""
+    results = []
+    for lines in args.lines:
+        command = [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_pipeline",
+            "--single",
+            str(lines),
+            "--lines-per-order",
+            str(args.lines_per_order),
+            "--payload-bytes",
+            str(args.payload_bytes),
+            "--sc-latency",
+            str(args.sc_latency),
+            "--qb-latency",
+            str(args.qb_latency),
+            "--sc-rps",
+            str(args.sc_rps),
+        ]
+        if args.batch:
+            command.append("--batch")
+        print(f"Running {lines} item lines...", file=sys.stderr)
+        completed = subprocess.run(
+            command,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            raise SystemExit(f"Benchmark with {lines} item lines failed")
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    stages = ["fetch", "aggregate", "report", "post", "resolve_id", "attach"]
+    header = ["lines", "wall_s", "req/s", "rss_mb"] + [f"{s}_s" for s in stages]
+    print(" ".join(f"{column:>12}" for column in header))
+    for result in results:
+        row = [
+            result["lines"],
+            result["wall_seconds"],
+            result["requests_per_second"],
+            result["peak_rss_mb"],
+        ] + [result["stage_seconds"].get(stage, 0.0) for stage in stages]
+        print(" ".join(f"{value:>12}" for value in row))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=DEFAULT_LINES)
+    parser.add_argument("--lines-per-order", type=int, default=3)
+    parser.add_argument(
+        "--payload-bytes",
+        type=int,
+        default=2000,
+        help="Filler bytes added to every order.",
+    )
+    parser.add_argument(
+        "--sc-latency", type=float, default=0.02, help="SellerCloud latency in seconds."
+    )
+    parser.add_argument(
+        "--qb-latency", type=float, default=0.05, help="QuickBooks latency in seconds."
+    )
+    parser.add_argument(
+        "--sc-rps",
+        type=float,
+        default=1000,
+        help="SellerCloud rate limit per endpoint, high by default to measure the pipeline.",
+    )
+    parser.add_argument(
+        "--batch", action="store_true", help="Post through the batch endpoint."
+    )
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.single:
+        run_single(args)
+    else:
+        run_all(args)
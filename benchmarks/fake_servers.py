@@ -0,0 +1,363 @@
+"""
+Local stand-ins for the SellerCloud and QuickBooks HTTP APIs used by the benchmarks,
+and for the SMTP server used by email_helper.
+
+The servers run in a background thread on a free local port, answer with generated
+data and sleep for a configurable latency before every response.
+"""
+
+import json
+import re
+import socketserver
+import threading
+import time
+from datetime import datetime
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeServer:
+    """Base class running a ThreadingHTTPServer and counting its requests."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, method, path, query, body):
+        """
+        Returns the status code and the JSON payload of a request, optionally followed
+        by a dictionary of extra response headers.
+        """
+        raise NotImplementedError
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parsed = urlparse(self.path)
+                if fake.latency:
+                    time.sleep(fake.latency)
+                status, payload, *headers = fake.handle(
+                    method, parsed.path, parse_qs(parsed.query), body
+                )
+                data = json.dumps(payload).encode("utf-8")
+                with fake.lock:
+                    fake.requests += 1
+                    fake.bytes_sent += len(data)
+                    fake.bytes_received += len(body)
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers[0] if headers else {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+        return Handler
+
+
+class FakeSellerCloud(FakeServer):
+    """
+    Stand-in for the SellerCloud token and Orders endpoints.
+
+    Every channel has orders_per_channel orders with lines_per_order item lines each,
+    all shipped on SHIP_DAY. Orders are generated from their position, so any page can
+    be served without holding the data set in memory. payload_bytes of filler are added
+    to every order to mimic the many fields SellerCloud returns. Ship times repeat
+    every SHIP_TIME_CYCLE orders, which lets ship date windows be served too.
+
+    Orders requests are first answered with the (status, headers) pairs appended to
+    errors, one per request, e.g. (429, {"Retry-After": "2"}). Every token request
+    gets a new token, counted in tokens_issued.
+    """
+
+    SHIP_DAY = datetime(2024, 7, 1)
+    SHIP_TIME_CYCLE = 120
+
+    def __init__(
+        self, orders_per_channel, lines_per_order=3, payload_bytes=0, latency=0.0
+    ):
+        super().__init__(latency)
+        self.orders_per_channel = orders_per_channel
+        self.lines_per_order = lines_per_order
+        self.filler = "x" * payload_bytes
+        self.errors = []
+        self.tokens_issued = 0
+
+    def handle(self, method, path, query, body):
+        if path.endswith("/token"):
+            with self.lock:
+                self.tokens_issued += 1
+                token = f"fake-token-{self.tokens_issued}"
+            return 200, {"access_token": token, "expires_in": 3600}
+        if path.endswith("/Orders"):
+            with self.lock:
+                error = self.errors.pop(0) if self.errors else None
+            if error:
+                status, headers = error
+                return status, {"Message": f"Fake error {status}"}, headers
+            return 200, self._orders_page(query)
+        return 404, {"Message": f"Unknown path {path}"}
+
+    def _orders_page(self, query):
+        channel = int(query["model.channel"][0])
+        page = int(query["model.pageNumber"][0])
+        page_size = int(query["model.pageSize"][0])
+        residues = self._residues_in_window(
+            query["model.shipFromDate"][0], query["model.shipToDate"][0]
+        )
+        total = sum(
+            (self.orders_per_channel - residue + self.SHIP_TIME_CYCLE - 1)
+            // self.SHIP_TIME_CYCLE
+            for residue in residues
+            if residue < self.orders_per_channel
+        )
+        first = (page - 1) * page_size
+        last = min(first + page_size, total)
+        return {
+            "Items": [
+                self._order(
+                    channel,
+                    position // len(residues) * self.SHIP_TIME_CYCLE
+                    + residues[position % len(residues)],
+                )
+                for position in range(first, last)
+            ],
+            "TotalResults": total,
+        }
+
+    def _residues_in_window(self, from_date, to_date):
+        """Returns the positions in the ship time cycle shipped inside the window."""
+        date_format = "%m/%d/%Y %H:%M:%S"
+        from_date = datetime.strptime(from_date, date_format)
+        to_date = datetime.strptime(to_date, date_format)
+        return [
+            residue
+            for residue in range(self.SHIP_TIME_CYCLE)
+            if from_date
+            <= self.SHIP_DAY.replace(hour=residue % 24, minute=residue % 60)
+            <= to_date
+        ]
+
+    def _order(self, channel, index):
+        order_id = channel * 1_000_000_000 + index
+        return {
+            "ID": order_id,
+            "OrderSourceOrderID": f"PO-{order_id}",
+            "ShipDate": f"{self.SHIP_DAY:%Y-%m-%d}T{index % 24:02d}:{index % 60:02d}:00.{index % 1000:03d}",
+            "Notes": self.filler,
+            "Items": [
+                {
+                    "ProductIDOriginal": f"SKU-{(index * 7 + line) % 5000}",
+                    "AverageCost": round(1 + (index + line) % 9000 / 100, 2),
+                    "Qty": 1 + line % 3,
+                }
+                for line in range(self.lines_per_order)
+            ],
+        }
+
+
+class FakeQuickBooks(FakeServer):
+    """
+    Stand-in for the QuickBooks endpoints used by QbAPI: Account and Class lookups,
+    queries, JournalEntry creation, batch requests and attachment uploads.
+    The journal entries created, with their TotalAmt, are kept in journal_entries and
+    JournalEntry queries by DocNumber are answered from it. Appending to
+    journal_entries stands for entries posted by earlier runs. The DocNumbers of every
+    batch request are kept in batches, and batch items whose DocNumber is in
+    failing_doc_numbers are answered with a Fault.
+    """
+
+    object_path = re.compile(r"/company/[^/]+/(account|class)/([^/]+)/?$")
+
+    def __init__(self, latency=0.0, failing_doc_numbers=()):
+        super().__init__(latency)
+        self.next_id = 1000
+        self.journal_entries = []
+        self.batches = []
+        self.failing_doc_numbers = set(failing_doc_numbers)
+
+    def handle(self, method, path, query, body):
+        match = self.object_path.search(path)
+        if match:
+            name = "Account" if match.group(1) == "account" else "Class"
+            return 200, {
+                name: {
+                    "Id": match.group(2),
+                    "Name": f"{name} {match.group(2)}",
+                    "FullyQualifiedName": f"{name} {match.group(2)}",
+                }
+            }
+        if path.endswith("/query"):
+            return 200, {"QueryResponse": self._query(body.decode("utf-8"))}
+        if path.endswith("/journalentry"):
+            return 200, {"JournalEntry": self._create(json.loads(body))}
+        if path.endswith("/batch"):
+            items = json.loads(body)["BatchItemRequest"]
+            with self.lock:
+                self.batches.append(
+                    [item["JournalEntry"]["DocNumber"] for item in items]
+                )
+            return 200, {
+                "BatchItemResponse": [self._batch_item(item) for item in items]
+            }
+        if path.endswith("/upload"):
+            return 200, {"AttachableResponse": [{"Attachable": {"Id": self._new_id()}}]}
+        return 404, {"Message": f"Unknown path {path}"}
+
+    def _query(self, statement):
+        if "from journalentry" not in statement.lower():
+            return {}
+        doc_numbers = set(re.findall(r"'([^']*)'", statement))
+        with self.lock:
+            journal_entries = [
+                journal_entry
+                for journal_entry in self.journal_entries
+                if journal_entry["DocNumber"] in doc_numbers
+            ]
+        if not journal_entries:
+            return {}
+        return {
+            "JournalEntry": journal_entries,
+            "startPosition": 1,
+            "maxResults": len(journal_entries),
+        }
+
+    def _create(self, journal_entry):
+        journal_entry = {
+            **journal_entry,
+            "Id": self._new_id(),
+            "TotalAmt": round(
+                sum(
+                    line["Amount"]
+                    for line in journal_entry["Line"]
+                    if line["JournalEntryLineDetail"]["PostingType"] == "Debit"
+                ),
+                2,
+            ),
+        }
+        with self.lock:
+            self.journal_entries.append(journal_entry)
+        return journal_entry
+
+    def _batch_item(self, item):
+        journal_entry = item["JournalEntry"]
+        if journal_entry["DocNumber"] in self.failing_doc_numbers:
+            return {
+                "bId": item["bId"],
+                "Fault": {
+                    "type": "ValidationFault",
+                    "Error": [
+                        {
+                            "Message": "Duplicate Document Number Error",
+                            "Detail": f"Duplicate Document Number Error : {journal_entry['DocNumber']}",
+                            "code": "6140",
+                        }
+                    ],
+                },
+            }
+        return {"bId": item["bId"], "JournalEntry": self._create(journal_entry)}
+
+    def _new_id(self):
+        with self.lock:
+            self.next_id += 1
+            return str(self.next_id)
+
+
+class FakeSmtp:
+    """
+    Plain SMTP stand-in that keeps the messages it receives. Point email_config at it
+    with use_ssl and login set to False.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.messages = []
+        self.server = socketserver.ThreadingTCPServer(
+            ("127.0.0.1", 0), self._handler_class()
+        )
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def host(self):
+        return "127.0.0.1"
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def _reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode())
+
+            def handle(self):
+                with fake.lock:
+                    fake.sessions += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                self._reply("220 fake smtp")
+                for line in self.rfile:
+                    command = line.decode().strip().upper()
+                    if command.startswith("QUIT"):
+                        self._reply("221 bye")
+                        return
+                    if command.startswith("DATA"):
+                        self._reply("354 end data with <CR><LF>.<CR><LF>")
+                        data = []
+                        for data_line in self.rfile:
+                            if data_line in (b".\r\n", b".\n"):
+                                break
+                            data.append(data_line)
+                        with fake.lock:
+                            fake.messages.append(message_from_bytes(b"".join(data)))
+                    self._reply("250 ok")
+
+        return Handler
@@ -15,19 +15,171 @@ sellercloud_endpoints = {
     "GET_SELLERCLOUD_ORDERS": {
         "type": "get",
         "url": sellercloud_base_url
-        + "Orders?model.companyID=163&model.orderStatus=3&model.shipFromDate={from}&model.shipToDate={to}&model.channel={channel}&model.pageNumber={page}&model.pageSize=50",
+        + "Orders?model.companyID={company_id}&model.orderStatus=3&model.shipFromDate={from}&model.shipToDate={to}&model.channel={channel}&model.pageNumber={page}&model.pageSize={page_size}",
         "endpoint_error_message": "while getting orders from SellerCloud: ",
         "success_message": "Got all orders from SellerCloud successfully!",
     },
     "GET_AMZ_VEN_ORDERS": {
         "type": "get",
         "url": sellercloud_base_url
-        + "Orders?model.companyID=163&model.orderStatus=3&model.shipFromDate={from}&model.shipToDate={to}&model.channel={channel}&model.userID=75437&model.pageNumber={page}&model.pageSize=50",
+        + "Orders?model.companyID={company_id}&model.orderStatus=3&model.shipFromDate={from}&model.shipToDate={to}&model.channel={channel}&model.userID={vendor_user_id}&model.pageNumber={page}&model.pageSize={page_size}",
         "endpoint_error_message": "while getting orders from SellerCloud: ",
         "success_message": "Got all orders from SellerCloud successfully!",
     },
 }
 
+# Values of the SellerCloud company placeholders in the endpoint urls.
+sellercloud_url_args = {
+    "company_id": 163,
+    "vendor_user_id": 75437,
+}
+
+# Orders per page requested from each paged endpoint, the {page_size} placeholder.
+sellercloud_page_sizes = {
+    "default": 50,
+    "GET_SELLERCLOUD_ORDERS": 50,
+    "GET_AMZ_VEN_ORDERS": 50,
+}
+
+# Ranges expected to have more than max_pages pages of orders are split into day or hour
+# windows of about window_pages pages each. The expected number of orders comes from the
+# order density, in orders per hour, last observed for the channel. At most max_windows
+# windows are fetched at the same time, sharing the endpoint's page concurrency. Orders
+# returned by two windows are only kept once.
+sellercloud_sharding_config = {
+    "enabled": True,
+    "max_pages": 20,
+    "window_pages": 10,
+    "max_windows": 4,
+}
+
+# Number of pages fetched at the same time for each paged endpoint.
+sellercloud_concurrency = {
+    "GET_SELLERCLOUD_ORDERS": 8,
+    "GET_AMZ_VEN_ORDERS": 4,
+}
+
+# Number of channels fetched at the same time.
+sellercloud_channel_concurrency = 3
+
+# Connection pool used by the SellerCloud HTTP session. The pool is never smaller than
+# the pages that can be fetched at the same time across channels, the largest
+# sellercloud_concurrency times sellercloud_channel_concurrency, pool_size only raises it.
+sellercloud_session = {
+    "pool_connections": 4,
+    "pool_size": 24,
+    "token_ttl_seconds": 3600,  # Used when the token response has no expires_in
+}
+
+# Token bucket and concurrency limits of each SellerCloud endpoint. "default" is used for
+# the endpoints that are not listed. The concurrency limit starts at max_concurrency and
+# is lowered automatically when SellerCloud throttles or slows down.
+sellercloud_rate_limits = {
+    "default": {"requests_per_second": 5, "burst": 5, "max_concurrency": 4},
+    "GET_SELLERCLOUD_ORDERS": {
+        "requests_per_second": 10,
+        "burst": 20,
+        "max_concurrency": 16,
+    },
+    "GET_AMZ_VEN_ORDERS": {
+        "requests_per_second": 5,
+        "burst": 10,
+        "max_concurrency": 4,
+    },
+}
+
+# Retries of failed SellerCloud requests. Waits grow exponentially from backoff_seconds
+# up to max_backoff_seconds, with jitter.
+sellercloud_retry_config = {
+    "max_attempts": 5,
+    "backoff_seconds": 1,
+    "max_backoff_seconds": 60,
+    "connect_timeout": 10,
+    "read_timeout": 120,
+    "target_latency_seconds": 10,
+}
+
+# Local cache of the raw SellerCloud orders by channel and ship date. Days fetched less
+# than settle_hours after they ended are only reused for recent_ttl_minutes, days
+# fetched after that are reused for ttl_days.
+order_cache_config = {
+    "enabled": True,
+    "path": "tmp/order_cache.sqlite3",
+    "settle_hours": 24,
+    "recent_ttl_minutes": 60,
+    "ttl_days": 30,
+}
+
+# Archive of the SellerCloud order pages of every run, a gzip NDJSON file with an index
+# in a directory per run, used by python main.py --replay. Only the last keep_runs runs
+# are kept.
+archive_config = {
+    "enabled": True,
+    "directory": "tmp/archive",
+    "keep_runs": 30,
+    "compress_level": 6,
+}
+
+# Stages of a run. Channels move from the report stage (fetch, aggregate and write) to
+# posting and report uploads on their own, so one channel can be posted while others
+# are still being fetched. queue_size bounds the channels waiting between two stages and
+# page_queue_size the pages fetched and aggregated ahead of the report writer.
+pipeline_config = {"queue_size": 2, "page_queue_size": 4}
+
+# Local SQLite ledger of the posted journal entries and the orders behind them. Reruns of
+# a period compare the orders with the ledger and only post an adjustment entry for the
+# difference, e.g. for late shipped or corrected orders.
+ledger_config = {"enabled": True, "path": "tmp/ledger.sqlite3"}
+
+# Formats each journal report is written in. The xlsx report is always written since it
+# is the one attached in QuickBooks, "csv.gz" and "parquet" copies can be added for
+# archival. Parquet needs pyarrow. summary_sheets adds the cost by SKU, by order and the
+# channel total as extra sheets of the xlsx report.
+report_config = {
+    "formats": ["xlsx"],
+    "summary_sheets": True,
+}
+
+# Number of periods processed at the same time by main.py --backfill.
+backfill_config = {
+    "max_workers": 2,
+}
+
+# Run metrics written at the end of every run: a JSON summary and a Prometheus textfile,
+# e.g. for the node_exporter textfile collector. Set a path to None to skip that file.
+metrics_config = {
+    "json_path": "tmp/metrics/run_summary.json",
+    "prometheus_path": "tmp/metrics/qb_journal_entry_creator.prom",
+}
+
+# Channels and journal entries of every run.
+run_config = {
+    "run_DF": True,
+    "run_WH": True,
+    "run_VN": True,
+    "run_combined": False,
+    "run_individual": True,
+    "post_in_batch": False,
+}
+
+# Long running mode, python main.py --daemon. Every job runs once a day at "at" (local
+# time, HH:MM) for the period of its frequency containing the day days_back days ago.
+# "weekday" (0 is Monday) and "day_of_month" limit a job to some days and "run_config"
+# overrides run_config for that job. Backfills are requested by dropping a JSON file like
+# {"start": "2024-07-01", "end": "2024-07-31", "frequency": "daily"} in
+# backfill_requests_dir. Tokens are refreshed token_refresh_margin_seconds before they
+# expire.
+scheduler_config = {
+    "poll_seconds": 30,
+    "error_wait_seconds": 300,
+    "token_refresh_margin_seconds": 300,
+    "state_path": "tmp/daemon_state.json",
+    "backfill_requests_dir": "tmp/backfill_requests",
+    "jobs": [
+        {"name": "daily", "frequency": "daily", "at": "02:00", "days_back": 1},
+    ],
+}
+
 db_config = {
     "ExampleDb": {
         "server": "example.database.windows.net",
@@ -58,6 +210,7 @@ def create_connection_string(server_config):
     )
 
 
+EMAIL_ENABLED = True  # When False emails are only printed, e.g. while benchmarking
 SENDER_EMAIL = "sender_email@domain.com"
 SENDER_PASSWORD = "sender_password"
 RECIPIENT_EMAILS = [
@@ -65,6 +218,22 @@ RECIPIENT_EMAILS = [
     "recipient_email_2@domain.com",
 ]  # List of emails to send the report
 
+# SMTP server and background sending of the emails. Emails with the same subject queued
+# within coalesce_seconds of each other are sent as a single digest, and every batch is
+# sent over one SMTP session. Set use_ssl and login to False to use a local plain SMTP
+# server, e.g. one started with benchmarks.fake_servers.FakeSmtp. notify_no_orders sends
+# a "No journal created" email for periods without orders.
+email_config = {
+    "smtp_host": "smtp.gmail.com",
+    "smtp_port": 465,
+    "use_ssl": True,
+    "login": True,
+    "coalesce_seconds": 30,
+    "max_digest_messages": 20,
+    "flush_timeout_seconds": 60,
+    "notify_no_orders": False,
+}
+
 
 client_data = {
     "client_id": "example_client_id",
@@ -73,6 +242,31 @@ client_data = {
     "environment": "sandbox",
     "realm_id": "example_realm_id",
     "access_token": "example_access_token",
+    "api_url": None,  # Overrides the QuickBooks API url, e.g. with a local stand-in server
+    "token_db": "QbExampleDb",  # db_config entry storing the refresh token
+}
+
+# Journal report uploads. Failed uploads are retried max_attempts times, waiting
+# backoff_seconds, doubled after every attempt.
+qb_upload_config = {
+    "max_workers": 4,
+    "max_attempts": 3,
+    "backoff_seconds": 2,
+}
+
+# QuickBooks accepts at most 30 operations per batch request. With post_in_batch, the
+# channels of a period that are ready at the same time share a batch request; every
+# period of a backfill is posted on its own.
+qb_batch_config = {
+    "max_items": 30,
+}
+
+# QuickBooks Account and Class references are cached on disk for ttl_hours so a new
+# session does not have to look them up again.
+qb_ref_cache_config = {
+    "persist": True,
+    "path": "tmp/qb_ref_cache.json",
+    "ttl_hours": 24,
 }
 
 ref_id_map = {
@@ -86,3 +280,28 @@ ref_id_map = {
         "class_ref_id": "fake_class_ref_id",
     },
 }
+
+# Companies processed by python main.py --tenants. Every tenant runs in a process of its
+# own, in the working directory <directory>/<name>, so its reports, caches, metrics and
+# tokens stay apart. The settings of a profile are merged into the settings with the
+# same name above. Tokens are stored in the db_config entry named by client_data
+# token_db.
+tenant_config = {
+    "max_workers": 4,
+    "directory": "tenants",
+    "report_path": "tenants/run_report.json",
+    "tenants": [
+        {
+            "name": "example",
+            "sellercloud_credentials": {"Username": "username", "Password": "password"},
+            "sellercloud_url_args": {"company_id": 163, "vendor_user_id": 75437},
+            "client_data": {"realm_id": "example_realm_id", "token_db": "QbExampleDb"},
+            "ref_id_map": {
+                "DF": {"class_ref_id": "fake_class_ref_id"},
+                "WH": {"class_ref_id": "fake_class_ref_id"},
+                "VN": {"class_ref_id": "fake_class_ref_id"},
+            },
+            "run_config": {},
+        },
+    ],
+}
@@ -0,0 +1,124 @@
+from decimal_rounding import subcents_to_amounts
+
+
+class CostSummary:
+    """
+    Per-SKU and per-order cost rollups of a channel, built page by page while the
+    journal report lines are aggregated, so the lines are only gone through once.
+
+    SKUs repeat across pages, their totals are kept in a dictionary. Orders never span
+    pages, so the per-order totals of every page are kept as arrays and only joined
+    when the summary sheets are built. Costs are kept in millionths of a unit and
+    rounded once per row.
+    """
+
+    def __init__(self):
+        self.skus = {}
+        self.order_pages = []
+
+    def add_page(self, lines, po_dates, line_orders, skus, qty, line_subcents):
+        """
+        Adds the item lines of a page. po_dates holds the formatted po_date of every
+        order, the other arrays hold one value per line.
+        """
+        import numpy as np
+        import pandas as pd
+
+        order_count = len(lines)
+        order_lines = np.bincount(line_orders, minlength=order_count)
+        order_qty = np.zeros(order_count, dtype=np.int64)
+        np.add.at(order_qty, line_orders, qty)
+        order_subcents = np.zeros(order_count, dtype=np.int64)
+        np.add.at(order_subcents, line_orders, line_subcents)
+        self.order_pages.append(
+            (
+                po_dates,
+                lines.order_ids,
+                lines.purchase_order_numbers,
+                order_lines,
+                order_qty,
+                order_subcents,
+            )
+        )
+
+        codes, page_skus = pd.factorize(skus)
+        sku_lines = np.bincount(codes, minlength=len(page_skus))
+        sku_qty = np.zeros(len(page_skus), dtype=np.int64)
+        np.add.at(sku_qty, codes, qty)
+        sku_subcents = np.zeros(len(page_skus), dtype=np.int64)
+        np.add.at(sku_subcents, codes, line_subcents)
+        for sku, sku_line_count, sku_qty_sum, sku_subcent_sum in zip(
+            page_skus.tolist(),
+            sku_lines.tolist(),
+            sku_qty.tolist(),
+            sku_subcents.tolist(),
+        ):
+            totals = self.skus.get(sku)
+            if totals is None:
+                self.skus[sku] = [sku_line_count, sku_qty_sum, sku_subcent_sum]
+            else:
+                totals[0] += sku_line_count
+                totals[1] += sku_qty_sum
+                totals[2] += sku_subcent_sum
+
+    def sheets(self, channel):
+        """
+        Returns the summary sheets as a dictionary of sheet name to DataFrame: the cost
+        by SKU, by order and the channel total.
+        """
+        import numpy as np
+        import pandas as pd
+
+        skus = sorted(self.skus)
+        sku_totals = np.array([self.skus[sku] for sku in skus], dtype=np.int64).reshape(
+            -1, 3
+        )
+        by_sku = pd.DataFrame(
+            {
+                "sku": skus,
+                "lines": sku_totals[:, 0],
+                "qty": sku_totals[:, 1],
+                "total_cost": subcents_to_amounts(sku_totals[:, 2]),
+            }
+        )
+
+        po_dates, order_ids, purchase_order_numbers = [], [], []
+        for page in self.order_pages:
+            po_dates.extend(page[0])
+            order_ids.extend(page[1])
+            purchase_order_numbers.extend(page[2])
+        order_lines, order_qty, order_subcents = (
+            np.concatenate(
+                [page[index] for page in self.order_pages]
+                or [np.zeros(0, dtype=np.int64)]
+            )
+            for index in (3, 4, 5)
+        )
+        by_order = pd.DataFrame(
+            {
+                "po_date": po_dates,
+                "sc_order_id": order_ids,
+                "purchase_order_number": purchase_order_numbers,
+                "lines": order_lines,
+                "qty": order_qty,
+                "total_cost": subcents_to_amounts(order_subcents),
+            }
+        )
+
+        channel_total = pd.DataFrame(
+            {
+                "channel": [channel],
+                "orders": [len(by_order)],
+                "skus": [len(by_sku)],
+                "lines": [int(order_lines.sum())],
+                "qty": [int(order_qty.sum())],
+                "total_cost": subcents_to_amounts(
+                    np.array([order_subcents.sum()], dtype=np.int64)
+                ),
+            }
+        )
+        return {
+            "By SKU": by_sku,
+            "By order": by_order,
+            "Channel total": channel_total,
+        }
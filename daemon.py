@@ -0,0 +1,169 @@
+import json
+import pathlib
+import signal
+import threading
+import traceback
+from datetime import datetime, timedelta
+import main
+from email_helper import send_email
+from seller_cloud_api import SellerCloudAPI
+from config import scheduler_config, run_config
+
+
+class Daemon:
+    """
+    Long running mode that runs the jobs of scheduler_config on schedule.
+
+    The SellerCloud and QuickBooks clients, their HTTP connection pools and the order
+    and reference caches are created once and shared by every job. Access tokens are
+    refreshed before they expire, so jobs never wait for a login. Backfills can be
+    requested at any time by dropping a JSON file in backfill_requests_dir.
+    """
+
+    def __init__(self):
+        self.stopping = threading.Event()
+        self.state_path = pathlib.Path(scheduler_config["state_path"])
+        self.last_runs = self._load_state()
+        self.h = main.create_helpers()
+        self.sc_api = SellerCloudAPI()
+        self.qb_api = None
+        self.qb_lock = threading.Lock()
+
+    def get_qb_api(self):
+        """Returns the QuickBooks client, connecting the first time it is needed."""
+        with self.qb_lock:
+            if self.qb_api is None:
+                self.qb_api = main.connect_qb_api()
+            return self.qb_api
+
+    def run_forever(self):
+        signal.signal(signal.SIGTERM, lambda *args: self.stopping.set())
+        signal.signal(signal.SIGINT, lambda *args: self.stopping.set())
+        jobs = ", ".join(
+            f"{job['name']} at {job['at']}" for job in scheduler_config["jobs"]
+        )
+        print(f"Daemon started. Jobs: {jobs}")
+
+        while not self.stopping.is_set():
+            wait = scheduler_config["poll_seconds"]
+            try:
+                self.run_once(datetime.now())
+            except Exception as e:
+                print(e)
+                send_email("Unexpected Error", traceback.format_exc())
+                wait = scheduler_config["error_wait_seconds"]
+            self.stopping.wait(wait)
+
+        print("Daemon stopped")
+
+    def run_once(self, now):
+        """Refreshes the tokens and runs the jobs and backfills that are due."""
+        self.refresh_tokens()
+        for job in self.due_jobs(now):
+            self.run_job(job, now)
+            if self.stopping.is_set():
+                return
+        self.run_backfill_requests()
+
+    def refresh_tokens(self):
+        """Refreshes the access tokens that expire within the refresh margin."""
+        margin = scheduler_config["token_refresh_margin_seconds"]
+        if self.sc_api.token_expires_in() < margin:
+            print("Refreshing the SellerCloud access token")
+            self.sc_api.authenticate()
+
+        with self.qb_lock:
+            if self.qb_api and self.qb_api.access_token_expires_in() < margin:
+                print("Refreshing the QuickBooks access token")
+                main.refresh_qb_api(self.qb_api)
+
+    def due_jobs(self, now):
+        """Yields the jobs scheduled for today, past their time, that did not run yet."""
+        today = now.date().isoformat()
+        for job in scheduler_config["jobs"]:
+            hour, minute = (int(part) for part in job["at"].split(":"))
+            if (now.hour, now.minute) < (hour, minute):
+                continue
+            if "weekday" in job and now.weekday() != job["weekday"]:
+                continue
+            if "day_of_month" in job and now.day != job["day_of_month"]:
+                continue
+            if self.last_runs.get(job["name"]) == today:
+                continue
+            yield job
+
+    def run_job(self, job, now):
+        """
+        Runs a scheduled job. A failed job is emailed by main and not retried until
+        its next scheduled day.
+        """
+        print(f"Running job {job['name']}")
+        try:
+            main.main(
+                h=self.h,
+                sc_api=self.sc_api,
+                get_qb_api=self.get_qb_api,
+                date=now - timedelta(days=job.get("days_back", 1)),
+                frequency=job["frequency"],
+                config={**run_config, **job.get("run_config", {})},
+            )
+        except Exception as e:
+            print(f"Job {job['name']} failed: {e}")
+
+        self.last_runs[job["name"]] = now.date().isoformat()
+        self._save_state()
+
+    def run_backfill_requests(self):
+        """
+        Runs the backfills requested in backfill_requests_dir, oldest first. Each
+        request file is renamed to .done or .failed once processed.
+        """
+        directory = pathlib.Path(scheduler_config["backfill_requests_dir"])
+        if not directory.is_dir():
+            return
+
+        for path in sorted(directory.glob("*.json"), key=lambda p: p.stat().st_mtime):
+            if self.stopping.is_set():
+                return
+            print(f"Running backfill request {path.name}")
+            try:
+                request = json.loads(path.read_text())
+                start_date, end_date = (
+                    datetime.strptime(request[key], "%Y-%m-%d")
+                    for key in ("start", "end")
+                )
+            except Exception as e:
+                print(f"Invalid backfill request {path.name}: {e}")
+                send_email(f"Invalid backfill request {path.name}", str(e))
+                path.rename(path.with_suffix(".failed"))
+                continue
+
+            try:
+                # Errors are emailed by backfill
+                main.backfill(
+                    start_date,
+                    end_date,
+                    request.get("frequency", "daily"),
+                    request.get("workers"),
+                    h=self.h,
+                    sc_api=self.sc_api,
+                    get_qb_api=self.get_qb_api,
+                    refresh_cache=request.get("refresh_cache", False),
+                )
+                path.rename(path.with_suffix(".done"))
+            except Exception as e:
+                print(f"Backfill request {path.name} failed: {e}")
+                path.rename(path.with_suffix(".failed"))
+
+    def _load_state(self):
+        try:
+            return json.loads(self.state_path.read_text())["last_runs"]
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Could not read the daemon state: {e}")
+            return {}
+
+    def _save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        self.state_path.write_text(json.dumps({"last_runs": self.last_runs}))
@@ -1,9 +1,49 @@
 from decimal import Decimal, ROUND_HALF_UP
 
+# Line amounts are kept as integers in millionths of a unit so that costs with up to six
+# decimals, times a quantity, add up exactly. Totals are then rounded once to whole
+# cents.
+SUBCENTS_PER_CENT = 10000
+SUBCENTS_PER_UNIT = 100 * SUBCENTS_PER_CENT
 
-def round_to_decimal(number):
-    """Round a number to a given precision."""
-    decimal_number = Decimal(str(number))
-    rounded_number = decimal_number.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
-    return float(rounded_number)
+def to_subcents(amounts):
+    """Convert an array of amounts to an int64 array of millionths of a unit."""
+    import numpy as np
+
+    return np.rint(np.asarray(amounts, dtype=np.float64) * SUBCENTS_PER_UNIT).astype(
+        np.int64
+    )
+
+
+def subcents_to_cents(subcents):
+    """Round an integer amount in millionths of a unit to whole cents, half up."""
+    subcents = int(subcents)
+    cents, remainder = divmod(abs(subcents), SUBCENTS_PER_CENT)
+    if remainder * 2 >= SUBCENTS_PER_CENT:
+        cents += 1
+    return cents if subcents >= 0 else -cents
+
+
+def subcents_to_amounts(subcents):
+    """
+    Round an array of amounts in millionths of a unit to amounts in whole cents, half
+    up like subcents_to_cents.
+    """
+    import numpy as np
+
+    subcents = np.asarray(subcents, dtype=np.int64)
+    cents = (np.abs(subcents) + SUBCENTS_PER_CENT // 2) // SUBCENTS_PER_CENT
+    return np.where(subcents < 0, -cents, cents) / 100
+
+
+def cents_to_amount(cents):
+    """Convert an integer amount in cents to the float sent to QuickBooks."""
+    return int(cents) / 100
+
+
+def amount_to_cents(amount):
+    """Convert an amount read from QuickBooks to integer cents, rounding half up."""
+    return int(
+        (Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+    )
@@ -1,31 +1,153 @@
 # email_helper.py
+import atexit
 import smtplib
+import queue
+import threading
+import time
 from email.message import EmailMessage
-from config import SENDER_EMAIL, SENDER_PASSWORD, RECIPIENT_EMAILS
+from config import SENDER_EMAIL, SENDER_PASSWORD, RECIPIENT_EMAILS, email_config
+import config
 import os
 import getpass
 import socket
 
 
+class EmailQueue:
+    """
+    Sends emails from a background thread so callers never wait for SMTP.
+
+    Once an email is queued the thread keeps collecting for coalesce_seconds. Emails
+    with the same subject are then merged into a single digest and the whole batch is
+    sent over one SMTP session. flush() sends the queued emails right away, it is called
+    when the process exits.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def put(self, subject, body):
+        # The folder is read now, the working directory may change before sending
+        folder_name = os.path.basename(os.getcwd())
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="email-queue", daemon=True
+                )
+                self.thread.start()
+        self.queue.put((subject, folder_name, body))
+
+    def flush(self, timeout=None):
+        """
+        Sends the queued emails without waiting for the coalescing window. Returns
+        False if they were not sent within the timeout.
+        """
+        if self.thread is None:
+            return True
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout or email_config["flush_timeout_seconds"])
+
+    def _run(self):
+        while True:
+            batch, flushes = self._collect()
+            if batch:
+                self._send(batch)
+            for done in flushes:
+                done.set()
+
+    def _collect(self):
+        """Waits for an email and collects the ones queued in the coalescing window."""
+        item = self.queue.get()
+        deadline = time.monotonic() + email_config["coalesce_seconds"]
+        batch, flushes = [], []
+        while True:
+            if isinstance(item, threading.Event):
+                flushes.append(item)
+                return batch, flushes
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return batch, flushes
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, flushes
+
+    def _send(self, batch):
+        groups = {}
+        for subject, folder_name, body in batch:
+            groups.setdefault((subject, folder_name), []).append(body)
+        messages = [
+            self._message(subject, folder_name, bodies)
+            for (subject, folder_name), bodies in groups.items()
+        ]
+
+        try:
+            smtp_class = smtplib.SMTP_SSL if email_config["use_ssl"] else smtplib.SMTP
+            with smtp_class(
+                email_config["smtp_host"], email_config["smtp_port"], timeout=30
+            ) as server:
+                if email_config["login"]:
+                    server.login(SENDER_EMAIL, SENDER_PASSWORD)
+                for msg in messages:
+                    server.send_message(msg)
+            print(
+                f"Email sent successfully: {', '.join(m['Subject'] for m in messages)}"
+            )
+        except Exception as e:
+            print(f"Error sending email: {e}")
+
+    def _message(self, subject, folder_name, bodies):
+        """Builds an email, or a digest of the emails sharing the same subject."""
+        if len(bodies) > 1:
+            counts = {}
+            for body in bodies:
+                counts[body] = counts.get(body, 0) + 1
+            max_messages = email_config["max_digest_messages"]
+            parts = [
+                f"{count} times:\n{body}" if count > 1 else body
+                for body, count in list(counts.items())[:max_messages]
+            ]
+            if len(counts) > max_messages:
+                parts.append(f"... and {len(counts) - max_messages} other messages")
+            subject = f"{subject} ({len(bodies)} times)"
+            body = "\n\n".join(parts)
+        else:
+            body = bodies[0]
+
+        computer_name = socket.gethostname()
+        user_name = getpass.getuser()
+        new_line = "\n"
+        body_with_new_line = (
+            f"{body}{new_line}{folder_name} on {computer_name} ({user_name})"
+        )
+        msg = EmailMessage()
+        msg.set_content(body_with_new_line)
+        msg["Subject"] = f"{subject} : {folder_name}"
+        msg["From"] = SENDER_EMAIL
+        msg["To"] = ", ".join(RECIPIENT_EMAILS)
+        return msg
+
+
+# Emails of the current process, sent in the background
+email_queue = EmailQueue()
+atexit.register(email_queue.flush)
+
+
 def send_email(subject, body):
-    current_dir = os.getcwd()
-    folder_name = os.path.basename(current_dir)
-    computer_name = socket.gethostname()
-    user_name = getpass.getuser()
-    new_line = "\n"
-    body_with_new_line = (
-        f"{body}{new_line}{folder_name} on {computer_name} ({user_name})"
-    )
-    msg = EmailMessage()
-    msg.set_content(body_with_new_line)
-    msg["Subject"] = f"{subject} : {folder_name}"
-    msg["From"] = SENDER_EMAIL
-    msg["To"] = ", ".join(RECIPIENT_EMAILS)
-
-    try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(msg)
-        print("Email sent successfully.")
-    except Exception as e:
-        print(f"Error sending email: {e}")
+    """Queues an email, it is sent in the background."""
+    if not config.EMAIL_ENABLED:
+        print(f"Email not sent, emails are disabled: {subject}")
+        return
+
+    email_queue.put(subject, body)
+
+
+def flush_emails(timeout=None):
+    """
+    Sends the queued emails now. Processes that skip atexit, like multiprocessing
+    workers, call it before they end.
+    """
+    return email_queue.flush(timeout)
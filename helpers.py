@@ -1,11 +1,29 @@
 from seller_cloud_api import SellerCloudAPI
 from email_helper import send_email
 from datetime import datetime
-import pandas as pd
-from qb_api import QbAPI
+
+# pandas and numpy are imported where they are used, so runs without orders do not pay
+# for loading them
+from decimal_rounding import to_subcents, subcents_to_cents
+from order_lines import OrderLines, slim_order
+from cost_summary import CostSummary
 import os
 import pathlib
+import math
+from collections import deque
+from itertools import chain
+from report_writer import report_writers
+from metrics import metrics
+from pipeline import prefetch
+from shard_planner import ShardPlanner
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from config import (
+    sellercloud_concurrency,
+    sellercloud_page_sizes,
+    sellercloud_sharding_config,
+    report_config,
+)
 
 
 class Frequency:
@@ -16,6 +34,15 @@ class Frequency:
 
 
 class Helpers:
+    def __init__(self, order_cache=None, ledger=None, archive=None, replay=None):
+        self.order_cache = order_cache
+        self.ledger = ledger
+        # ResponseArchive the fetched pages are written to, and the one orders are
+        # read from instead of SellerCloud when replaying a run
+        self.archive = archive
+        self.replay = replay
+        self.shard_planner = ShardPlanner()
+
     def get_channel_amounts(self, invoices, channel):
         """Gets the total amount of the invoices."""
         rows = []
@@ -55,26 +82,96 @@ class Helpers:
 
         return dt_obj.strftime("%Y-%m-%d %I:%M %p").lower()
 
-    def get_channel_cost_amounts(self, orders, channel):
-        """Gets the total amount of the invoices."""
-        rows = []
-        total_amount = 0
-        for order in orders:
-            for item in order["Items"]:
-                item_cost = item["AverageCost"]
-                rows.append(
-                    {
-                        "po_date": self.format_po_date(order["ShipDate"]),
-                        "sc_order_id": order["ID"],
-                        "purchase_order_number": order["OrderSourceOrderID"],
-                        "sku": item["ProductIDOriginal"],
-                        "item_cost": item_cost,
-                        "qty": item["Qty"],
-                        "total_cost": item_cost * item["Qty"],
-                    }
-                )
-                total_amount += item_cost * item["Qty"]
-        return total_amount, rows
+    def get_channel_cost_amounts(self, orders, channel, summary=None):
+        """
+        Gets the total cost of the orders in cents and the journal report rows as a
+        DataFrame. The per-SKU and per-order totals are added to summary, a
+        CostSummary, when it is given.
+        """
+        frame, amount_subcents = self.build_cost_frame(orders, {}, summary=summary)
+        return subcents_to_cents(amount_subcents), frame
+
+    def iter_channel_cost_frames(self, pages, totals):
+        """
+        Yields a journal report DataFrame for each page of orders.
+
+        The exact cost in millionths of a unit, the number of orders and the number of
+        item lines are added to totals["amount_subcents"], totals["orders"] and
+        totals["lines"] as the frames are consumed. When totals["order_subcents"] is a
+        dictionary the cost of every order is added to it too, and when
+        totals["summary"] is a CostSummary the per-SKU and per-order totals.
+        """
+        po_dates = {}
+        for page in pages:
+            frame, amount_subcents = self.build_cost_frame(
+                page, po_dates, totals.get("order_subcents"), totals.get("summary")
+            )
+            totals["orders"] += len(page)
+            totals["lines"] += len(frame)
+            totals["amount_subcents"] += amount_subcents
+            yield frame
+
+    def build_cost_frame(self, orders, po_dates, order_subcents=None, summary=None):
+        """
+        Builds the journal report columns for a batch of orders.
+
+        The item lines are packed into an OrderLines and the costs are computed on
+        whole arrays. Order level columns are filled by indexing with the order of
+        every line. po_dates maps each ShipDate to its formatted po_date, so every
+        distinct ShipDate is only parsed once. Returns the DataFrame and the exact total
+        cost of the batch in millionths of a unit. The exact cost of every order is
+        added to order_subcents, by order ID, when it is given, and the per-SKU and
+        per-order totals to summary, from the same arrays.
+        """
+        with metrics.span("aggregate"):
+            return self._build_cost_frame(
+                OrderLines.from_orders(orders), po_dates, order_subcents, summary
+            )
+
+    def _build_cost_frame(
+        self, lines: OrderLines, po_dates, order_subcents=None, summary=None
+    ):
+        import numpy as np
+        import pandas as pd
+
+        formatted_dates = []
+        for ship_date in lines.ship_dates:
+            formatted_date = po_dates.get(ship_date)
+            if formatted_date is None:
+                formatted_date = po_dates[ship_date] = self.format_po_date(ship_date)
+            formatted_dates.append(formatted_date)
+
+        line_orders = np.frombuffer(lines.line_orders, dtype=np.int64)
+        item_cost = np.frombuffer(lines.item_costs, dtype=np.float64)
+        qty = np.frombuffer(lines.qtys, dtype=np.int64)
+        # Every line amount is rounded once, after the multiplication, like the report's
+        # total_cost column
+        line_subcents = to_subcents(item_cost * qty)
+        amount_subcents = int(line_subcents.sum())
+        skus = np.array(lines.skus, dtype=object)
+        if summary is not None:
+            summary.add_page(
+                lines, formatted_dates, line_orders, skus, qty, line_subcents
+            )
+        if order_subcents is not None:
+            order_totals = np.zeros(len(lines), dtype=np.int64)
+            np.add.at(order_totals, line_orders, line_subcents)
+            for order_id, order_total in zip(lines.order_ids, order_totals.tolist()):
+                order_subcents[order_id] = order_subcents.get(order_id, 0) + order_total
+        frame = pd.DataFrame(
+            {
+                "po_date": np.array(formatted_dates, dtype=object)[line_orders],
+                "sc_order_id": np.array(lines.order_ids)[line_orders],
+                "purchase_order_number": np.array(
+                    lines.purchase_order_numbers, dtype=object
+                )[line_orders],
+                "sku": skus,
+                "item_cost": item_cost,
+                "qty": qty,
+                "total_cost": item_cost * qty,
+            }
+        )
+        return frame, amount_subcents
 
     def create_date_range(self, date, frequency: Frequency):
         """Finds the first and last date according to the frequency."""
@@ -88,9 +185,11 @@ class Helpers:
 
         elif frequency == "monthly":
             first_day = date.replace(day=1).strftime("%m/%d/%Y 00:00:00")
-            last_day = (
-                date.replace(month=date.month + 1, day=1) - timedelta(days=1)
-            ).strftime("%m/%d/%Y 23:59:59")
+            # Day 28 plus 4 days is always in the next month, December included
+            next_month = date.replace(day=28) + timedelta(days=4)
+            last_day = (next_month - timedelta(days=next_month.day)).strftime(
+                "%m/%d/%Y 23:59:59"
+            )
 
         return first_day, last_day
 
@@ -116,6 +215,36 @@ class Helpers:
         # Return the new date range in the desired string format
         return first_day.strftime(date_format), last_day.strftime(date_format)
 
+    def split_date_range(self, start_date, end_date, frequency: Frequency):
+        """
+        Splits the days from start_date to end_date, both included, into date ranges of
+        the given frequency. Weeks and months are cut at the start and end dates, and
+        weeks are also cut at the end of the month like in create_date_range.
+        """
+        date_ranges = []
+        day = start_date
+        while day <= end_date:
+            next_month = day.replace(day=28) + timedelta(days=4)
+            end_of_month = next_month - timedelta(days=next_month.day)
+            if frequency == "daily":
+                last_day = day
+            elif frequency == "weekly":
+                last_day = min(day + timedelta(days=6 - day.weekday()), end_of_month)
+            elif frequency == "monthly":
+                last_day = end_of_month
+            else:
+                raise ValueError(f"Invalid frequency: {frequency}")
+            last_day = min(last_day, end_date)
+
+            date_ranges.append(
+                (
+                    day.strftime("%m/%d/%Y 00:00:00"),
+                    last_day.strftime("%m/%d/%Y 23:59:59"),
+                )
+            )
+            day = last_day + timedelta(days=1)
+        return date_ranges
+
     def split_dict(self, input_dict, chunk_size):
         """
         Splits a dictionary into a list of dictionaries of a designated size.
@@ -134,68 +263,492 @@ class Helpers:
 
         return chunked_dicts
 
-    def get_sc_orders(
-        self, from_date, to_date, channel, sc_api: SellerCloudAPI, channel_name=None
+    def iter_sc_order_pages(
+        self,
+        from_date,
+        to_date,
+        channel,
+        sc_api: SellerCloudAPI,
+        channel_name=None,
+        max_workers=None,
     ):
-        """Gets orders from SellerCloud."""
-        try:
-            orders = []
-            page = 1
-            while True:
-                if channel_name == "VN":
-                    excecute = "GET_AMZ_VEN_ORDERS"
+        """
+        Yields pages of orders from SellerCloud in page order.
+
+        When an order cache is set and the range covers whole days, cached days are
+        served locally, each as a single page, and only the missing days are fetched
+        from SellerCloud, at the same time like the windows of a large range. Their
+        pages are passed on as they arrive and every day is cached once it is complete.
+        When replaying, pages come from the replayed archive.
+        """
+        action = self._get_orders_action(channel_name)
+        if self.replay:
+            yield from self.replay.iter_pages(action, channel, from_date, to_date)
+            return
 
+        days = None
+        if self.order_cache:
+            days = self.order_cache.split_days(from_date, to_date)
+        if not days:
+            yield from self._fetch_sc_order_pages(
+                from_date, to_date, channel, sc_api, channel_name, max_workers
+            )
+            return
+
+        cache_key = f"{action}:{channel}"
+        missing_days = [day for day in days if not self.order_cache.has(cache_key, day)]
+        metrics.count("order_cache_days", len(missing_days), result="miss")
+        metrics.count("order_cache_days", len(days) - len(missing_days), result="hit")
+
+        fetched_days = self._fetch_sc_order_days(
+            missing_days, channel, sc_api, action, max_workers
+        )
+        missing = set(missing_days)
+        try:
+            for day in days:
+                day_from, day_to = self.order_cache.day_range(day)
+                if day in missing:
+                    pages = next(fetched_days)
                 else:
-                    excecute = "GET_SELLERCLOUD_ORDERS"
-
-                response = sc_api.execute(
-                    {
-                        "url_args": {
-                            "from": from_date,
-                            "to": to_date,
-                            "channel": channel,
-                            "page": page,
-                        }
-                    },
-                    excecute,
+                    orders = self.order_cache.get(cache_key, day)
+                    if orders is not None:
+                        if self.archive:
+                            self.archive.record(
+                                action,
+                                channel,
+                                day_from,
+                                day_to,
+                                1,
+                                {"Items": orders, "TotalResults": len(orders)},
+                                "order_cache",
+                            )
+                        if orders:
+                            yield orders
+                        continue
+                    # The day went stale since it was looked up
+                    pages = self._fetch_sc_order_pages(
+                        day_from, day_to, channel, sc_api, channel_name, max_workers
+                    )
+
+                orders = []
+                for page in pages:
+                    orders.extend(page)
+                    yield page
+                self.order_cache.put(cache_key, day, orders)
+                self.shard_planner.observe(
+                    (action, channel), day_from, day_to, len(orders)
                 )
+        finally:
+            fetched_days.close()
 
-                if response.status_code == 200:
-                    if response.json()["Items"]:
-                        orders.extend(response.json()["Items"])
-                        page += 1
-                    else:
+    def _fetch_sc_order_days(self, days, channel, sc_api, action, max_workers=None):
+        """
+        Yields an iterator over the pages of every day, in day order. The days are
+        fetched at the same time through _fetch_sc_order_windows, days expected to have
+        many pages split further by the shard planner. The iterator of a day has to be
+        consumed before the next one is taken. Orders are only yielded once, by ID.
+        """
+        if max_workers is None:
+            max_workers = sellercloud_concurrency.get(action, 1)
+        page_size = sellercloud_page_sizes.get(
+            action, sellercloud_page_sizes["default"]
+        )
+        density = self.shard_planner.density((action, channel))
+
+        day_windows = []
+        for day in days:
+            day_from, day_to = self.order_cache.day_range(day)
+            if density is None:
+                day_windows.append([(day_from, day_to)])
+            else:
+                day_windows.append(
+                    self.shard_planner.plan(day_from, day_to, page_size, density)
+                )
+        windows = list(chain.from_iterable(day_windows))
+        if len(windows) > len(days):
+            metrics.count("sellercloud_windows", len(windows), endpoint=action)
+        windows = self._fetch_sc_order_windows(
+            windows, channel, sc_api, action, max_workers
+        )
+
+        def get_day_pages(window_count):
+            for _ in range(window_count):
+                yield from next(windows)
+
+        seen = set()
+        try:
+            for window_list in day_windows:
+                yield self._unique_pages(get_day_pages(len(window_list)), action, seen)
+        finally:
+            windows.close()
+
+    def _fetch_sc_order_pages(
+        self,
+        from_date,
+        to_date,
+        channel,
+        sc_api: SellerCloudAPI,
+        channel_name=None,
+        max_workers=None,
+    ):
+        """
+        Yields pages of orders fetched from SellerCloud.
+
+        Ranges expected to have many pages are split by the shard planner into day or
+        hour windows that are fetched at the same time, see _fetch_sc_order_windows.
+        The order density is taken from the first page of the range the first time a
+        channel is fetched and from the previous fetches after that. Orders are only
+        yielded once, by ID, however many windows or pages return them.
+        """
+        action = self._get_orders_action(channel_name)
+        if max_workers is None:
+            max_workers = sellercloud_concurrency.get(action, 1)
+        page_size = sellercloud_page_sizes.get(
+            action, sellercloud_page_sizes["default"]
+        )
+        density_key = (action, channel)
+
+        first_response = None
+        density = self.shard_planner.density(density_key)
+        if density is None:
+            first_response = self._get_sc_orders_page(
+                from_date, to_date, channel, 1, sc_api, action
+            )
+            total_results = first_response.get("TotalResults")
+            if total_results is not None:
+                self.shard_planner.observe(
+                    density_key, from_date, to_date, total_results
+                )
+                density = self.shard_planner.density(density_key)
+
+        windows = [(from_date, to_date)]
+        if density is not None:
+            windows = self.shard_planner.plan(from_date, to_date, page_size, density)
+
+        if len(windows) == 1:
+            pages = self._fetch_sc_window_pages(
+                from_date, to_date, channel, sc_api, action, max_workers, first_response
+            )
+        else:
+            print(
+                f"Fetching channel {channel} from {from_date} to {to_date} in {len(windows)} windows"
+            )
+            metrics.count("sellercloud_windows", len(windows), endpoint=action)
+            pages = chain.from_iterable(
+                self._fetch_sc_order_windows(
+                    windows, channel, sc_api, action, max_workers
+                )
+            )
+            if first_response is not None:
+                # The first page of the whole range was already fetched, it is kept
+                pages = chain([first_response["Items"]], pages)
+        del first_response
+
+        seen = set()
+        yield from self._unique_pages(pages, action, seen)
+        self.shard_planner.observe(density_key, from_date, to_date, len(seen))
+
+    def _unique_pages(self, pages, action, seen):
+        """Yields the pages without the orders whose ID is in seen, adding the IDs."""
+        for page in pages:
+            unique_page = []
+            for order in page:
+                if order["ID"] not in seen:
+                    seen.add(order["ID"])
+                    unique_page.append(order)
+            if len(unique_page) < len(page):
+                metrics.count(
+                    "duplicate_orders", len(page) - len(unique_page), endpoint=action
+                )
+            if unique_page:
+                yield unique_page
+
+    def _fetch_sc_order_windows(self, windows, channel, sc_api, action, max_workers):
+        """
+        Yields an iterator over the pages of every window, in window order, that passes
+        the pages on as they arrive. Windows are fetched at most max_windows at a time,
+        each prefetched in its own thread, and the endpoint's max_workers page fetches
+        are split between them. Every window in flight holds at most page_queue_size
+        pages that were not passed on yet. The iterator of a window has to be consumed
+        before the next one is taken.
+        """
+        max_windows = max(
+            1,
+            min(sellercloud_sharding_config["max_windows"], max_workers, len(windows)),
+        )
+        window_workers = max(1, max_workers // max_windows)
+
+        in_flight = deque()
+        windows = iter(windows)
+        try:
+            while True:
+                while len(in_flight) < max_windows:
+                    window = next(windows, None)
+                    if window is None:
                         break
-                else:
-                    print(f"Error: Received status code {response.status_code}")
-                    raise Exception(
-                        f"Error: Received while getting orders from SellerCloud code {response.status_code}"
+                    from_date, to_date = window
+                    in_flight.append(
+                        prefetch(
+                            self._fetch_sc_window_pages(
+                                from_date,
+                                to_date,
+                                channel,
+                                sc_api,
+                                action,
+                                window_workers,
+                            )
+                        )
                     )
 
-            return orders
-        except Exception as e:
-            print(f"There was an error getting the orders from SellerCloud: {e}")
-            return None
+                if not in_flight:
+                    return
+                pages = in_flight.popleft()
+                try:
+                    yield pages
+                finally:
+                    pages.close()
+        finally:
+            for pages in in_flight:
+                pages.close()
+
+    def _fetch_sc_window_pages(
+        self,
+        from_date,
+        to_date,
+        channel,
+        sc_api: SellerCloudAPI,
+        action,
+        max_workers,
+        first_response=None,
+    ):
+        """
+        Yields the pages of orders of a single date window in page order.
+
+        The first page, unless it is given, is fetched on its own to find out how many
+        pages there are. The remaining pages are fetched concurrently with at most
+        max_workers pages in flight, so only a few pages are held in memory at any
+        time. When SellerCloud does not return a total, pages are requested until an
+        empty one shows up. Orders only keep the fields listed in
+        order_lines.ORDER_FIELDS and ITEM_FIELDS.
+        """
+        if first_response is None:
+            first_response = self._get_sc_orders_page(
+                from_date, to_date, channel, 1, sc_api, action
+            )
+        first_page = first_response["Items"]
+        if not first_page:
+            return
+
+        # The first page is full whenever there is more than one page.
+        total_results = first_response.get("TotalResults")
+        last_page = None
+        if total_results is not None:
+            last_page = math.ceil(total_results / len(first_page))
+        del first_response
+        yield first_page
+        del first_page
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = deque()
+            next_page = 2
+            while True:
+                while len(in_flight) < max_workers and (
+                    last_page is None or next_page <= last_page
+                ):
+                    in_flight.append(
+                        executor.submit(
+                            self._get_sc_orders_page,
+                            from_date,
+                            to_date,
+                            channel,
+                            next_page,
+                            sc_api,
+                            action,
+                        )
+                    )
+                    next_page += 1
+
+                if not in_flight:
+                    return
+
+                page = in_flight.popleft().result()["Items"]
+                if not page:
+                    for future in in_flight:
+                        future.cancel()
+                    return
+                yield page
+
+    def _get_orders_action(self, channel_name):
+        if channel_name == "VN":
+            return "GET_AMZ_VEN_ORDERS"
+        return "GET_SELLERCLOUD_ORDERS"
+
+    def _get_sc_orders_page(self, from_date, to_date, channel, page, sc_api, action):
+        """Gets a single page of orders from SellerCloud."""
+        with metrics.span("fetch"):
+            return self._fetch_sc_orders_page(
+                from_date, to_date, channel, page, sc_api, action
+            )
+
+    def _fetch_sc_orders_page(self, from_date, to_date, channel, page, sc_api, action):
+        response = sc_api.execute(
+            {
+                "url_args": {
+                    "from": from_date,
+                    "to": to_date,
+                    "channel": channel,
+                    "page": page,
+                    "page_size": sellercloud_page_sizes.get(
+                        action, sellercloud_page_sizes["default"]
+                    ),
+                }
+            },
+            action,
+        )
+
+        if response is None:
+            raise Exception(
+                f"Error: No response while getting orders from SellerCloud page {page}"
+            )
+        if response.status_code != 200:
+            print(f"Error: Received status code {response.status_code}")
+            raise Exception(
+                f"Error: Received while getting orders from SellerCloud code {response.status_code}"
+            )
+        metrics.count("sellercloud_pages", endpoint=action)
+        # Only the fields used by the reports are kept from every order
+        data = response.json()
+        if self.archive:
+            self.archive.record(
+                action, channel, from_date, to_date, page, data, "sellercloud"
+            )
+        data["Items"] = [slim_order(order) for order in data["Items"]]
+        return data
 
     def failure_reporting(self, where, po):
         send_email(f"Error {where}", f"Error creating order for PO: {po}.")
 
-    def create_journal_report(self, rows, channel):
+    def create_journal_report(
+        self, frames, channel, formats=None, sub_dir=None, summary=None
+    ):
+        """
+        Writes the journal report and returns the path of the xlsx file.
+
+        frames can be a single DataFrame or any iterable of DataFrames with the same
+        columns, they are written one at a time so the report never has to be held in
+        memory. The report is also written in every extra format listed in formats
+        (report_config["formats"] by default), in the same pass. sub_dir keeps the
+        reports of different periods of the same run apart. When summary, a
+        CostSummary filled while the frames were built, is given its sheets are added
+        to the xlsx report after the rows.
+        """
+        import pandas as pd
+
         channel_name_map = {
             "VN": "amazon_vendor",
             "DF": "direct_fulfillment",
             "WH": "dropship",
         }
 
-        df = pd.DataFrame(rows)
-        directory = self._create_local_dir()
-        file_name = os.path.join(directory, f"{channel_name_map[channel]}_orders.xlsx")
-        df.to_excel(file_name, index=False)
+        if isinstance(frames, pd.DataFrame):
+            frames = [frames]
+        formats = dict.fromkeys(["xlsx", *(formats or report_config["formats"])])
+
+        directory = self._create_local_dir(sub_dir)
+        file_name = os.path.join(directory, f"{channel_name_map[channel]}_orders")
+        writers = []
+        closed = False
+        try:
+            for file_format in formats:
+                writers.append(
+                    report_writers[file_format](f"{file_name}.{file_format}")
+                )
+
+            for frame in frames:
+                with metrics.span("report"):
+                    for writer in writers:
+                        writer.write(frame)
+            with metrics.span("report"):
+                if summary is not None:
+                    # The xlsx writer always comes first
+                    for sheet_name, frame in summary.sheets(channel).items():
+                        writers[0].add_sheet(sheet_name, frame)
+                for writer in writers:
+                    writer.close()
+            closed = True
+        finally:
+            if not closed:
+                # Half written reports would be picked up by later runs, none is kept
+                for writer in writers:
+                    try:
+                        writer.abort()
+                    except Exception as e:
+                        print(
+                            f"Could not remove the partial report {writer.file_path}: {e}"
+                        )
 
-        return file_name
+        return f"{file_name}.xlsx"
+
+    def create_channel_report(
+        self,
+        from_date,
+        to_date,
+        channel,
+        channel_id,
+        sc_api,
+        sub_dir=None,
+        keep_empty=False,
+    ):
+        """
+        Streams the channel orders from SellerCloud into its journal report.
+
+        Fetching, aggregating and writing run in their own threads connected by bounded
+        queues, so the next pages are fetched and aggregated while earlier ones are
+        being written. Returns a dictionary with the channel amount in cents, the number of orders,
+        the report path and, when a ledger is set, the cost of every order in millionths
+        of a unit. Returns None if the orders could not be fetched, and if there were no
+        orders unless keep_empty is set, in which case the report has no rows.
+        """
+        try:
+            pages = prefetch(
+                self.iter_sc_order_pages(
+                    from_date, to_date, channel_id, sc_api, channel_name=channel
+                )
+            )
+            first_page = next(pages, None)
+            if not first_page and not keep_empty:
+                return None
+
+            pages = chain([first_page] if first_page else [], pages)
+            del first_page
+            totals = {"amount_subcents": 0, "orders": 0, "lines": 0}
+            if self.ledger:
+                totals["order_subcents"] = {}
+            if report_config["summary_sheets"]:
+                totals["summary"] = CostSummary()
+            # totals is complete once the report has read the last frame
+            report_path = self.create_journal_report(
+                prefetch(self.iter_channel_cost_frames(pages, totals)),
+                channel,
+                sub_dir=sub_dir,
+                summary=totals.get("summary"),
+            )
+            metrics.count("orders", totals["orders"], channel=channel)
+            metrics.count("lines", totals["lines"], channel=channel)
+            return {
+                "channel_cents": subcents_to_cents(totals["amount_subcents"]),
+                "order_count": totals["orders"],
+                "report_path": report_path,
+                "order_subcents": totals.get("order_subcents"),
+            }
+        except Exception as e:
+            print(f"There was an error getting the orders from SellerCloud: {e}")
+            return None
 
-    def _create_local_dir(self):
+    def _create_local_dir(self, sub_dir=None):
         dir_name = f"{datetime.now().strftime('%b%d,%Y').upper()}"
         local_dir = pathlib.Path(f"tmp/{dir_name}")
+        if sub_dir:
+            local_dir = local_dir / sub_dir
         local_dir.mkdir(parents=True, exist_ok=True)
         return local_dir
@@ -0,0 +1,149 @@
+import pathlib
+import sqlite3
+import threading
+from datetime import datetime
+from config import ledger_config
+
+
+class Ledger:
+    """
+    Local SQLite record of the journal entries posted to QuickBooks.
+
+    Every channel period has a base journal entry, {channel}_COG_{date}_SC, and
+    possibly adjustment entries posted by later runs. The ledger keeps the amount of
+    every entry and the SellerCloud orders, with their exact amounts in millionths of a
+    unit, that the entries of a period add up to. A rerun compares the orders it
+    fetched with the ledger and only posts the difference.
+    """
+
+    def __init__(self, path=None):
+        self.path = pathlib.Path(path or ledger_config["path"])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "doc_number TEXT PRIMARY KEY, "
+            "base_doc_number TEXT NOT NULL, "
+            "channel TEXT NOT NULL, "
+            "to_date TEXT NOT NULL, "
+            "cents INTEGER NOT NULL, "
+            "journal_entry_id TEXT, "
+            "posted_at TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS postings_base ON postings (base_doc_number)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS posted_orders ("
+            "base_doc_number TEXT NOT NULL, "
+            "order_id INTEGER NOT NULL, "
+            "amount_subcents INTEGER NOT NULL, "
+            "PRIMARY KEY (base_doc_number, order_id))"
+        )
+        self.conn.commit()
+
+    def posted_cents(self, base_doc_number):
+        """
+        Returns the cents posted for a channel period, adjustments included, or None if
+        nothing was posted for it.
+        """
+        with self.lock:
+            count, cents = self.conn.execute(
+                "SELECT COUNT(*), SUM(cents) FROM postings WHERE base_doc_number = ?",
+                (base_doc_number,),
+            ).fetchone()
+        return cents if count else None
+
+    def has_postings(self, channel, to_date):
+        """Returns whether anything was posted for a channel on the day of to_date."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM postings WHERE channel = ? AND substr(to_date, 1, 10) = ?",
+                (channel, to_date[:10]),
+            ).fetchone()
+        return row is not None
+
+    def next_adjustment_doc_number(self, base_doc_number):
+        """
+        Returns the DocNumber of the next adjustment of a channel period, the base
+        DocNumber followed by A and the adjustment number. QuickBooks allows 21
+        characters, which leaves room for 99 adjustments.
+        """
+        with self.lock:
+            (count,) = self.conn.execute(
+                "SELECT COUNT(*) FROM postings WHERE base_doc_number = ?",
+                (base_doc_number,),
+            ).fetchone()
+        return f"{base_doc_number}A{count}"
+
+    def posted_orders(self, base_doc_number):
+        """Returns the orders of a channel period as a dictionary of ID to subcents."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT order_id, amount_subcents FROM posted_orders "
+                "WHERE base_doc_number = ?",
+                (base_doc_number,),
+            ).fetchall()
+        return dict(rows)
+
+    def diff(self, base_doc_number, order_subcents):
+        """
+        Compares the orders fetched for a channel period with the posted ones. Returns
+        the number of new, changed and removed orders.
+        """
+        posted = self.posted_orders(base_doc_number)
+        new = changed = 0
+        for order_id, amount in order_subcents.items():
+            posted_amount = posted.pop(order_id, None)
+            if posted_amount is None:
+                new += 1
+            elif posted_amount != amount:
+                changed += 1
+        return {"new": new, "changed": changed, "removed": len(posted)}
+
+    def record(
+        self,
+        doc_number,
+        base_doc_number,
+        channel,
+        to_date,
+        cents,
+        journal_entry_id,
+        order_subcents,
+    ):
+        """
+        Records a posted journal entry and replaces the orders of its channel period
+        with the ones it was computed from.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO postings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    doc_number,
+                    base_doc_number,
+                    channel,
+                    to_date,
+                    int(cents),
+                    journal_entry_id,
+                    datetime.now().isoformat(),
+                ),
+            )
+            self._replace_orders(base_doc_number, order_subcents)
+
+    def update_orders(self, base_doc_number, order_subcents):
+        """Replaces the orders of a channel period without posting anything."""
+        with self.lock, self.conn:
+            self._replace_orders(base_doc_number, order_subcents)
+
+    def _replace_orders(self, base_doc_number, order_subcents):
+        self.conn.execute(
+            "DELETE FROM posted_orders WHERE base_doc_number = ?", (base_doc_number,)
+        )
+        self.conn.executemany(
+            "INSERT INTO posted_orders VALUES (?, ?, ?)",
+            (
+                (base_doc_number, int(order_id), int(amount))
+                for order_id, amount in order_subcents.items()
+            ),
+        )
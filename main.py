@@ -1,156 +1,677 @@
-from quick_books_db import QuickBooksDb
 from seller_cloud_api import SellerCloudAPI
-from qb_api import QbAPI
 from email_helper import send_email
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import threading
 import traceback
-from helpers import Helpers
-from decimal_rounding import round_to_decimal
+from helpers import Helpers, Frequency
+from decimal_rounding import cents_to_amount
+from order_cache import OrderCache
+from ledger import Ledger
+from response_archive import ResponseArchive
+from attachment_uploader import AttachmentUploader
+from metrics import metrics
+from pipeline import Pipeline
+from config import (
+    order_cache_config,
+    ledger_config,
+    backfill_config,
+    metrics_config,
+    archive_config,
+    run_config,
+    sellercloud_channel_concurrency,
+    qb_upload_config,
+    qb_batch_config,
+    email_config,
+)
 
 
-def main():
-    try:
-        config = {
-            "run_DF": True,
-            "run_WH": True,
-            "run_VN": True,
-            "run_combined": False,
-            "run_individual": True,
-        }
+def get_channels(config):
+    """Gets the SellerCloud channel ids of the channels enabled in the config."""
+    channels = {}
+    if config["run_DF"]:
+        channels["DF"] = 66  # DF
+    if config["run_WH"]:
+        channels["WH"] = 21  # Dropship
+    if config["run_VN"]:
+        channels["VN"] = 0  # Amazon Vendor
+    return channels
 
-        class Frequency:
-            def __init__(self):
-                self.daily = "daily"
-                self.weekly = "weekly"
-                self.monthly = "monthly"
 
-        h = Helpers()
-        f = Frequency()
-        sc_api = SellerCloudAPI()
+def connect_qb_api():
+    """Creates the QuickBooks client, storing the refresh token if it changed."""
+    # Imported here so pyodbc and the QuickBooks libraries are only loaded when
+    # there is something to post
+    from quick_books_db import QuickBooksDb
+    from qb_api import QbAPI
 
-        today = datetime.now() - timedelta(days=1)
+    qb_db = QuickBooksDb()
+    current_refresh_token = qb_db.get_refresh_token()
+    qb_api = QbAPI(current_refresh_token)
 
-        # from_date, to_date = h.create_date_range(today, f.monthly)
-        from_date, to_date = h.create_date_range(today, f.daily)
-        print(f"Date range. From date: {from_date}, To date: {to_date}")
+    if qb_api.client.refresh_token != current_refresh_token:
+        qb_db.update_refresh_token(qb_api.client.refresh_token)
+    return qb_api
 
-        # Getting orders------------------------------------------------------------------------
-        all_orders = {}
-
-        # DF
-        if config["run_DF"]:
-            df_orders = h.get_sc_orders(from_date, to_date, 66, sc_api)
-            if df_orders:
-                all_orders["DF"] = df_orders
-
-        # Dropship
-        if config["run_WH"]:
-            dropship_orders = h.get_sc_orders(from_date, to_date, 21, sc_api)
-            if dropship_orders:
-                all_orders["WH"] = dropship_orders
-
-        # Amazon Vendor
-        if config["run_VN"]:
-            amz_ven_orders = h.get_sc_orders(
-                from_date, to_date, 0, sc_api, channel_name="VN"
-            )
-            if amz_ven_orders:
-                all_orders["VN"] = amz_ven_orders
 
-        if all_orders:
+def refresh_qb_api(qb_api):
+    """Refreshes the QuickBooks access token, storing the refresh token if it changed."""
+    from quick_books_db import QuickBooksDb
+
+    current_refresh_token = qb_api.client.refresh_token
+    qb_api.refresh_access_token()
+    if qb_api.client.refresh_token != current_refresh_token:
+        QuickBooksDb().update_refresh_token(qb_api.client.refresh_token)
+
 
-            # Extracting cost of goods sold from SellerCloud------------------------------------------------------------------------
-            qb_db = QuickBooksDb()
-            current_refresh_token = qb_db.get_refresh_token()
-            qb_api = QbAPI(current_refresh_token)
+def lazy_qb_api():
+    """Returns a function that connects to QuickBooks the first time it is called."""
+    lock = threading.Lock()
+    qb_apis = []
 
-            if qb_api.client.refresh_token != current_refresh_token:
-                qb_db.update_refresh_token(qb_api.client.refresh_token)
+    def get_qb_api():
+        with lock:
+            if not qb_apis:
+                qb_apis.append(connect_qb_api())
+            return qb_apis[0]
 
-            channel_amounts_and_report = {}
+    return get_qb_api
 
-            for channel, orders in all_orders.items():
-                print(f"Processing {channel} - {len(orders)} orders...")
 
-                # Extracting channel amounts and creating journal report rows
-                channel_amount, report_rows = h.get_channel_cost_amounts(
-                    orders, channel
+def process_period(
+    h, sc_api, get_qb_api, from_date, to_date, config, sub_dir=None, notify=True
+):
+    """
+    Fetches, aggregates, reports and posts the journal entries of one date range.
+
+    Channels go through a pipeline: report (fetch, aggregate and write), post and
+    attach. Each channel moves to the next stage as soon as it is done with the
+    previous one, so a channel can be posted while others are still being fetched.
+    QuickBooks is only connected to, through get_qb_api, when a channel has orders to
+    post. When no channel has orders the run stops right after the fetch, before pandas,
+    the QuickBooks libraries or the database driver are loaded. Returns a summary with
+    the orders and amount of every channel and the journal entries created.
+    """
+    summary = {
+        "from_date": from_date,
+        "to_date": to_date,
+        "channels": {},
+        "journals_created": [],
+    }
+    channels = get_channels(config)
+    channel_reports = {}
+    journals_attached = {}
+    qb_api = uploader = None
+    if h.archive:
+        h.archive.add_period(from_date, to_date, config)
+
+    # Getting orders and extracting cost of goods sold from SellerCloud------------------------------------------------------------------------
+    # Orders are streamed page by page into each channel's journal report
+    def report_stage(channel):
+        # A channel posted before gets an empty report when all its orders are gone,
+        # so plan_postings reverses what was posted
+        keep_empty = bool(h.ledger and h.ledger.has_postings(channel, to_date))
+        report = h.create_channel_report(
+            from_date,
+            to_date,
+            channel,
+            channels[channel],
+            sc_api,
+            sub_dir,
+            keep_empty=keep_empty,
+        )
+        if not report:
+            return
+        channel_reports[channel] = report
+        print(
+            f"Channel: {channel}, Order: {report['order_count']} Amount: {cents_to_amount(report['channel_cents'])}"
+        )
+        if config["run_individual"]:
+            yield channel
+
+    # Creating individual journal entries------------------------------------------------------------------------
+    def post_stage(channels_to_post):
+        nonlocal qb_api, uploader
+        if qb_api is None:
+            qb_api = get_qb_api()
+            uploader = AttachmentUploader(qb_api)
+        reports = {channel: channel_reports[channel] for channel in channels_to_post}
+        to_post = plan_postings(h.ledger, qb_api, reports, to_date)
+        created = post_journal_entries(
+            qb_api, to_post, to_date, config["post_in_batch"]
+        )
+
+        for journal_entry_number, journal_entry_id in created.items():
+            posting = to_post[journal_entry_number]
+            channel = posting["channel"]
+            if h.ledger:
+                h.ledger.record(
+                    journal_entry_number,
+                    posting["base_doc_number"],
+                    channel,
+                    to_date,
+                    posting["cents"],
+                    journal_entry_id,
+                    reports[channel]["order_subcents"],
                 )
+            yield channel, journal_entry_number, journal_entry_id
 
-                channel_amount = round_to_decimal(channel_amount)
-                report_path = h.create_journal_report(report_rows, channel)
+    # Reports are uploaded as soon as their entry exists
+    def attach_stage(posted):
+        channel, journal_entry_number, journal_entry_id = posted
+        print(f"Individual journal entry {journal_entry_number} created for {channel}")
+        result = uploader.upload(
+            channel_reports[channel]["report_path"], journal_entry_id
+        )
+        if result["ok"]:
+            print(f"File attached to journal entry for {channel}")
+            journals_attached.setdefault(channel, []).append(journal_entry_number)
+        return ()
 
-                channel_amounts_and_report[channel] = {
-                    "channel_amount": channel_amount,
-                    "report_path": report_path,
-                }
+    pipeline = Pipeline().add_stage(
+        "report", report_stage, workers=sellercloud_channel_concurrency
+    )
+    if config["run_individual"]:
+        pipeline.add_stage(
+            "post",
+            post_stage,
+            # Channels ready at the same time are checked in QuickBooks in one query
+            # and, with post_in_batch, posted in one batch request. Batches never span
+            # periods: every period of a backfill posts its own channels.
+            batch_size=qb_batch_config["max_items"],
+        )
+        pipeline.add_stage(
+            "attach", attach_stage, workers=qb_upload_config["max_workers"]
+        )
+    try:
+        pipeline.run(channels)
+    finally:
+        if uploader:
+            uploader.close()
+
+    # The summary lists the channels in their configured order, whatever order they
+    # finished in
+    summary["channels"] = {
+        channel: {
+            "orders": channel_reports[channel]["order_count"],
+            "amount": cents_to_amount(channel_reports[channel]["channel_cents"]),
+        }
+        for channel in channels
+        if channel in channel_reports
+    }
+    summary["journals_created"] = [
+        journal_entry_number
+        for channel in channels
+        for journal_entry_number in journals_attached.get(channel, [])
+    ]
+
+    # Channels with orders in their configured order
+    channel_amounts_and_report = {
+        channel: channel_reports[channel]
+        for channel in channels
+        if channel in channel_reports and channel_reports[channel]["order_count"]
+    }
+
+    # Nothing to do, no orders in any channel and nothing to reverse------------------------------------------------------------------------
+    if not channel_amounts_and_report and not summary["journals_created"]:
+        print(f"No orders from {from_date} to {to_date}, nothing to post")
+        if config["run_individual"] and notify and email_config["notify_no_orders"]:
+            send_email(
+                "No journal created",
+                "There was no sales data to create journal with.",
+            )
+        return summary
+
+    if config["run_individual"]:
+        print("Individual journal entries created")
+        if notify:
+            entries_str = ", ".join(summary["journals_created"])
+            send_email(
+                "Journal Entries Created",
+                f"Journal entries created: {entries_str}",
+            )
+
+    # Creating combined journal entry------------------------------------------------------------------------
+    if config["run_combined"] and channel_amounts_and_report:
+        qb_api = qb_api or get_qb_api()
+        journal_entry_number = qb_api.create_combined_journal_entry(
+            channel_amounts_and_report, to_date
+        )
+        print(f"Combined journal created, entry number: {journal_entry_number}")
+        journal_entry_id = qb_api.get_journal_entry_id(journal_entry_number)
+        uploader = AttachmentUploader(qb_api)
+        for amount in channel_amounts_and_report.values():
+            uploader.submit(amount["report_path"], journal_entry_id)
+        for result in uploader.wait():
+            if result["ok"]:
                 print(
-                    f"Channel: {channel}, Order: {len(orders)} Amount: {channel_amount}"
+                    f"File {result['file_path']} \nattached to journal entry {journal_entry_number}"
                 )
+        uploader.close()
 
-            # Creating individual journal entries------------------------------------------------------------------------
-            if config["run_individual"]:
-                journals_created = []
-                if not channel_amounts_and_report:
-                    send_email(
-                        "No journal created",
-                        "There was no sales data to create journal with.",
-                    )
+        if journal_entry_number:
+            summary["journals_created"].append(journal_entry_number)
+        print("Combined journal entry created")
 
-                for channel, data in channel_amounts_and_report.items():
-                    amount = data["channel_amount"]
-                    report_path = data["report_path"]
+    return summary
 
-                    if amount > 0:
-                        journal_entry_number = qb_api.create_journal_entry(
-                            amount, channel, to_date
-                        )
-                        if journal_entry_number:
-                            journal_entry_id = qb_api.get_journal_entry_id(
-                                journal_entry_number
-                            )
-                            if journal_entry_id:
-                                print(
-                                    f"Individual journal entry {journal_entry_number} created for {channel}"
-                                )
-                                if qb_api.attach_file_to_journal_entry(
-                                    report_path, journal_entry_id
-                                ):
-                                    print(
-                                        f"File attached to journal entry for {channel}"
-                                    )
-                                    journals_created.append(journal_entry_number)
-
-                print("Individual journal entries created")
-                entries_str = ", ".join(journals_created)
-                send_email(
-                    "Journal Entries Created",
-                    f"Journal entries created: {entries_str}",
-                )
 
-            # Creating combined journal entry------------------------------------------------------------------------
-            if config["run_combined"]:
-                journal_entry_number = qb_api.create_combined_journal_entry(
-                    channel_amounts_and_report, to_date
+def post_journal_entries(qb_api, to_post, to_date, post_in_batch):
+    """
+    Posts the journal entries planned by plan_postings, in a single batch request or
+    one by one. Returns a dictionary of DocNumber to Id of the entries created.
+    """
+    created = {}
+    if post_in_batch:
+        results = qb_api.batch_create_journal_entries(
+            [
+                (posting["cents"], posting["channel"], to_date, doc_number)
+                for doc_number, posting in to_post.items()
+            ]
+        )
+        for journal_entry_number, result in results.items():
+            if result["status"] == "created":
+                created[journal_entry_number] = result["id"]
+            else:
+                print(
+                    f"Error creating journal entry {journal_entry_number} for {result['channel']}: {result['error']}"
                 )
-                print(f"Combined journal created, entry number: {journal_entry_number}")
+    else:
+        for doc_number, posting in to_post.items():
+            journal_entry_number = qb_api.create_journal_entry(
+                posting["cents"], posting["channel"], to_date, doc_number
+            )
+            if journal_entry_number:
                 journal_entry_id = qb_api.get_journal_entry_id(journal_entry_number)
-                for file_path in [
-                    amount["report_path"]
-                    for amount in channel_amounts_and_report.values()
-                ]:
-                    if qb_api.attach_file_to_journal_entry(file_path, journal_entry_id):
+                if journal_entry_id:
+                    created[journal_entry_number] = journal_entry_id
+    return created
+
+
+def plan_postings(ledger, qb_api, channel_reports, to_date):
+    """
+    Decides which journal entries to post for the channels of a period. Returns a
+    dictionary of DocNumber to the channel, the cents and the base DocNumber.
+
+    Without a ledger a channel's entry is posted unless it already exists in QuickBooks.
+    With a ledger a channel that was posted before only gets an adjustment entry for the
+    difference between its current and posted amounts, and nothing when none of its
+    orders changed. A base entry found in QuickBooks but missing in the ledger, e.g.
+    posted before the ledger existed, is recorded with its QuickBooks total and the
+    difference with the current orders gets an adjustment entry.
+    """
+    plans = {}
+    for channel, data in channel_reports.items():
+        base_doc_number = qb_api.journal_entry_doc_number(channel, to_date)
+        plan = {
+            "channel": channel,
+            "cents": data["channel_cents"],
+            "base_doc_number": base_doc_number,
+        }
+        posted_cents = ledger.posted_cents(base_doc_number) if ledger else None
+        if posted_cents is None:
+            plans[base_doc_number] = plan
+            continue
+
+        changes = ledger.diff(base_doc_number, data["order_subcents"])
+        if not any(changes.values()):
+            print(f"Journal entry {base_doc_number} is up to date for {channel}")
+            continue
+
+        plan["cents"] = data["channel_cents"] - posted_cents
+        print(
+            f"{channel}: {changes['new']} new, {changes['changed']} changed and "
+            f"{changes['removed']} removed orders since {base_doc_number} was posted"
+        )
+        if plan["cents"] == 0:
+            ledger.update_orders(base_doc_number, data["order_subcents"])
+            continue
+        plans[ledger.next_adjustment_doc_number(base_doc_number)] = plan
+
+    # Checking which journal entries were already posted in a single query
+    already_posted = qb_api.resolve_journal_entry_ids(list(plans))
+
+    to_post = {}
+    for doc_number, plan in plans.items():
+        channel = plan["channel"]
+        journal_entry_id = already_posted.get(doc_number)
+        if journal_entry_id:
+            print(f"Journal entry {doc_number} already exists for {channel}")
+            if ledger:
+                posted_cents = plan["cents"]
+                if doc_number == plan["base_doc_number"]:
+                    posted_cents = qb_api.get_journal_entry_cents(doc_number)
+                    if posted_cents is None:
                         print(
-                            f"File {file_path} \nattached to journal entry {journal_entry_number}"
+                            f"Warning: the total of {doc_number} is not known, it is "
+                            f"recorded with the current amount and no adjustment is posted"
                         )
+                        posted_cents = plan["cents"]
+                # With a difference to post, the orders are only recorded with the
+                # adjustment, so a rerun retries it if posting fails
+                order_subcents = channel_reports[channel]["order_subcents"]
+                if posted_cents != plan["cents"]:
+                    order_subcents = {}
+                ledger.record(
+                    doc_number,
+                    plan["base_doc_number"],
+                    channel,
+                    to_date,
+                    posted_cents,
+                    journal_entry_id,
+                    order_subcents,
+                )
+                if posted_cents != plan["cents"]:
+                    # QuickBooks holds a different amount than the current orders
+                    print(
+                        f"{channel}: {doc_number} holds {cents_to_amount(posted_cents)}, "
+                        f"the current orders add up to {cents_to_amount(plan['cents'])}"
+                    )
+                    adjustment = {**plan, "cents": plan["cents"] - posted_cents}
+                    to_post[ledger.next_adjustment_doc_number(doc_number)] = adjustment
+        elif doc_number != plan["base_doc_number"] or plan["cents"] > 0:
+            to_post[doc_number] = plan
+    return to_post
+
 
-                print("Combined journal entry created")
+def create_helpers():
+    order_cache = OrderCache() if order_cache_config["enabled"] else None
+    ledger = Ledger() if ledger_config["enabled"] else None
+    return Helpers(order_cache=order_cache, ledger=ledger)
+
+
+def write_metrics(success, **run_info):
+    """Writes the run metrics and prints the time spent in every stage."""
+    try:
+        metrics.write(
+            metrics_config["json_path"],
+            metrics_config["prometheus_path"],
+            success=success,
+            **run_info,
+        )
+    except Exception as e:
+        print(f"Could not write the run metrics: {e}")
+    print_stages()
+
+
+def print_stages():
+    for stage, timing in metrics.stages().items():
+        print(
+            f"Stage {stage}: {timing['seconds']:.2f}s in {timing['count']} calls, "
+            f"p95 {timing['p95_seconds']:.2f}s"
+        )
+
+
+def start_archive(h, **run_info):
+    """Starts archiving the SellerCloud pages of the run, see archive_config."""
+    h.archive = None
+    if not archive_config["enabled"]:
+        return
+    try:
+        h.archive = ResponseArchive.create(**run_info)
+    except Exception as e:
+        print(f"Could not start the SellerCloud response archive: {e}")
+
+
+def finish_archive(h, success):
+    if not h or not h.archive:
+        return
+    try:
+        h.archive.finish(success)
+        print(f"SellerCloud responses archived in {h.archive.directory}")
+    except Exception as e:
+        print(f"Could not finish the SellerCloud response archive: {e}")
+    h.archive = None
+
+
+def replay(directory):
+    """
+    Runs the periods of an archived run again from its archived SellerCloud pages,
+    without any network access. Reports are written like in a regular run, journal
+    entries are only printed and saved to dry_run_entries.json in the archive. The
+    ledger is not used. Returns the summary of every period.
+    """
+    from qb_api import DryRunQbAPI
+
+    metrics.reset()
+    archive = ResponseArchive.open(directory)
+    h = Helpers(replay=archive)
+    qb_api = DryRunQbAPI()
+    print(f"Replaying {len(archive.periods)} periods of {archive.directory}")
+
+    summaries = []
+    for period in archive.periods:
+        day = datetime.strptime(period["from_date"][:10], "%m/%d/%Y")
+        summaries.append(
+            process_period(
+                h,
+                None,
+                lambda: qb_api,
+                period["from_date"],
+                period["to_date"],
+                period["config"],
+                sub_dir=f"replay_{archive.name}/{day:%Y-%m-%d}",
+                notify=False,
+            )
+        )
+
+    (archive.directory / "dry_run_entries.json").write_text(
+        json.dumps(qb_api.entries, indent=2)
+    )
+    print_stages()
+    return summaries
+
+
+def main(
+    h=None,
+    sc_api=None,
+    get_qb_api=None,
+    date=None,
+    frequency=Frequency().daily,
+    config=None,
+):
+    """
+    Creates the journal entries of the period of the given frequency containing date,
+    yesterday by default. The daemon passes its already connected h, sc_api and
+    get_qb_api, a regular run creates its own. Returns a list with the summary of the
+    period, like backfill.
+    """
+    metrics.reset()
+    success = False
+    periods = []
+    try:
+        h = h or create_helpers()
+        start_archive(h, mode=frequency)
+        sc_api = sc_api or SellerCloudAPI()
+        get_qb_api = get_qb_api or lazy_qb_api()
+        date = date or datetime.now() - timedelta(days=1)
+
+        from_date, to_date = h.create_date_range(date, frequency)
+        print(f"Date range. From date: {from_date}, To date: {to_date}")
+
+        periods.append(
+            process_period(
+                h, sc_api, get_qb_api, from_date, to_date, config or run_config
+            )
+        )
+        print(f"SellerCloud requests: {sc_api.get_request_stats()}")
+        success = True
+        return periods
+
+    except Exception as e:
+        print(e)
+        send_email("Unexpected Error", traceback.format_exc())
+        raise e
+    finally:
+        write_metrics(success, mode=frequency, periods=periods)
+        finish_archive(h, success)
+
+
+def backfill(
+    start_date,
+    end_date,
+    frequency="daily",
+    max_workers=None,
+    h=None,
+    sc_api=None,
+    get_qb_api=None,
+    refresh_cache=False,
+):
+    """
+    Processes every period between start_date and end_date, both included.
+
+    The range is split into periods of the given frequency and the periods are
+    processed with at most max_workers (backfill_config by default) at the same time.
+    Each period posts its own journal entries, like a regular run would. A summary of
+    every period is printed and emailed at the end. Like in main, the daemon passes
+    its own h, sc_api and get_qb_api. With refresh_cache the cached orders of the range
+    are dropped first, so late shipped or corrected orders are fetched again.
+    """
+    metrics.reset()
+    success = False
+    summaries = []
+    try:
+        h = h or create_helpers()
+        start_archive(h, mode="backfill", frequency=frequency)
+        if refresh_cache and h.order_cache:
+            print(
+                f"Refreshing the cached orders from {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}"
+            )
+            h.order_cache.invalidate(from_day=start_date.date(), to_day=end_date.date())
+        sc_api = sc_api or SellerCloudAPI()
+        get_qb_api = get_qb_api or lazy_qb_api()
+        date_ranges = h.split_date_range(start_date, end_date, frequency)
+        print(f"Backfilling {len(date_ranges)} {frequency} periods")
+
+        def run(date_range):
+            from_date, to_date = date_range
+            sub_dir = datetime.strptime(from_date[:10], "%m/%d/%Y").strftime("%Y-%m-%d")
+            try:
+                return process_period(
+                    h,
+                    sc_api,
+                    get_qb_api,
+                    from_date,
+                    to_date,
+                    run_config,
+                    sub_dir=sub_dir,
+                    notify=False,
+                )
+            except Exception as e:
+                print(f"Error processing {from_date} - {to_date}: {e}")
+                return {
+                    "from_date": from_date,
+                    "to_date": to_date,
+                    "channels": {},
+                    "journals_created": [],
+                    "error": traceback.format_exc(),
+                }
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers or backfill_config["max_workers"]
+        ) as executor:
+            summaries = list(executor.map(run, date_ranges))
+
+        lines = []
+        for summary in summaries:
+            channels = ", ".join(
+                f"{channel}: {data['orders']} orders {data['amount']}"
+                for channel, data in summary["channels"].items()
+            )
+            journals = ", ".join(summary["journals_created"])
+            status = "ERROR" if summary.get("error") else "OK"
+            lines.append(
+                f"{status} {summary['from_date']} - {summary['to_date']} | "
+                f"{channels or 'no orders'} | journals: {journals or 'none'}"
+            )
+        report = "\n".join(lines)
+        print(report)
+        send_email("Backfill finished", report)
+        success = not any(summary.get("error") for summary in summaries)
+        return summaries
 
     except Exception as e:
         print(e)
         send_email("Unexpected Error", traceback.format_exc())
         raise e
+    finally:
+        write_metrics(success, mode="backfill", periods=summaries)
+        finish_archive(h, success)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Creates the QuickBooks cost of goods sold journal entries."
+    )
+    parser.add_argument(
+        "--backfill",
+        nargs=2,
+        metavar=("START", "END"),
+        help="Process every day from START to END (YYYY-MM-DD) instead of yesterday.",
+    )
+    parser.add_argument(
+        "--frequency",
+        choices=list(vars(Frequency()).values()),
+        default=Frequency().daily,
+        help="Period of each backfill journal entry.",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Number of backfill periods processed at once."
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Fetch the backfill range from SellerCloud again instead of the order cache.",
+    )
+    parser.add_argument(
+        "--tenants",
+        nargs="*",
+        metavar="NAME",
+        help="Run every tenant of tenant_config, or only the named ones, in parallel.",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="ARCHIVE",
+        help="Run an archived run again from its SellerCloud pages, e.g. "
+        "tmp/archive/20240702_020000_000000, without posting anything.",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and run the jobs of scheduler_config on schedule.",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    start_date = end_date = None
+    if args.backfill:
+        start_date, end_date = (
+            datetime.strptime(date, "%Y-%m-%d") for date in args.backfill
+        )
+
+    if args.replay:
+        replay(args.replay)
+    elif args.daemon:
+        from daemon import Daemon
+
+        Daemon().run_forever()
+    elif args.tenants is not None:
+        from tenants import run_tenants
+
+        run_tenants(
+            args.tenants, start_date, end_date, args.frequency, args.refresh_cache
+        )
+    elif args.backfill:
+        backfill(
+            start_date,
+            end_date,
+            args.frequency,
+            args.workers,
+            refresh_cache=args.refresh_cache,
+        )
+    else:
+        main()
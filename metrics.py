@@ -0,0 +1,242 @@
+import json
+import os
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+PROMETHEUS_PREFIX = "qb_journal_"
+
+METRIC_HELP = {
+    "stage_seconds": "Time spent in each pipeline stage, added up across threads.",
+    "sellercloud_request_seconds": "Latency of every SellerCloud request attempt.",
+    "sellercloud_requests": "SellerCloud requests by endpoint and status code.",
+    "sellercloud_response_bytes": "Bytes received from SellerCloud.",
+    "sellercloud_pages": "Pages of orders fetched from SellerCloud.",
+    "sellercloud_windows": "Date windows large SellerCloud ranges were split into.",
+    "duplicate_orders": "Orders returned more than once by SellerCloud and dropped.",
+    "quickbooks_request_seconds": "Latency of QuickBooks requests.",
+    "quickbooks_requests": "QuickBooks requests by operation and status code.",
+    "quickbooks_request_bytes": "Bytes sent to QuickBooks.",
+    "order_cache_days": "Days of orders served from or missing in the order cache.",
+    "orders": "Orders aggregated into journal reports.",
+    "lines": "Item lines aggregated into journal reports.",
+    "attachments": "Journal report uploads by result.",
+    "attachment_bytes": "Bytes of journal reports uploaded.",
+}
+
+
+class Histogram:
+    """Counts observations in fixed buckets, like a Prometheus histogram."""
+
+    def __init__(self):
+        self.buckets = LATENCY_BUCKETS
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[index] += 1
+                break
+
+    def quantile(self, q):
+        """Estimates a quantile by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            if bucket_count and seen + bucket_count >= rank:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "seconds": round(self.sum, 6),
+            "max_seconds": round(self.max, 6),
+            "p50_seconds": round(self.quantile(0.5), 6),
+            "p95_seconds": round(self.quantile(0.95), 6),
+            "p99_seconds": round(self.quantile(0.99), 6),
+        }
+
+
+class Metrics:
+    """
+    Counters, latency histograms and stage timings of a run, shared by every thread.
+
+    Stages are timed with span(), requests with observe() and volumes with count().
+    At the end of a run write() saves a JSON summary and a Prometheus textfile.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = datetime.now()
+            self.start = time.perf_counter()
+            self.counters = {}
+            self.histograms = {}
+
+    def count(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, stage):
+        """Times the block as one call of the given pipeline stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage)
+
+    def stages(self):
+        """Returns the timings of every stage, the slowest first."""
+        with self.lock:
+            stages = {
+                dict(labels)["stage"]: histogram.to_dict()
+                for (name, labels), histogram in self.histograms.items()
+                if name == "stage_seconds"
+            }
+        return dict(
+            sorted(stages.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        )
+
+    def summary(self, **run_info):
+        """Returns the metrics of the run as a JSON serializable dictionary."""
+        with self.lock:
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                counters.setdefault(name, []).append(
+                    {"labels": dict(labels), "value": value}
+                )
+            histograms = {}
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name != "stage_seconds":
+                    histograms.setdefault(name, []).append(
+                        {"labels": dict(labels), **histogram.to_dict()}
+                    )
+
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "duration_seconds": round(time.perf_counter() - self.start, 3),
+            "run": run_info,
+            "stages": self.stages(),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def prometheus_text(self, success=True):
+        """Formats the metrics in the Prometheus text exposition format."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = [
+                (key, list(histogram.bucket_counts), histogram.count, histogram.sum)
+                for key, histogram in sorted(self.histograms.items())
+            ]
+
+        lines = []
+        described = set()
+
+        def describe(metric, name, metric_type):
+            if metric in described:
+                return
+            described.add(metric)
+            if name in METRIC_HELP:
+                lines.append(f"# HELP {metric} {METRIC_HELP[name]}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+
+        for (name, labels), value in counters:
+            metric = f"{PROMETHEUS_PREFIX}{name}_total"
+            describe(metric, name, "counter")
+            lines.append(f"{metric}{self._labels(labels)} {value}")
+
+        for (name, labels), bucket_counts, count, total in histograms:
+            metric = f"{PROMETHEUS_PREFIX}{name}"
+            describe(metric, name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = self._labels(labels + (("le", f"{bound:g}"),))
+                lines.append(f"{metric}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = self._labels(labels + (("le", "+Inf"),))
+            lines.append(f"{metric}_bucket{bucket_labels} {count}")
+            lines.append(f"{metric}_sum{self._labels(labels)} {total}")
+            lines.append(f"{metric}_count{self._labels(labels)} {count}")
+
+        for name, value in (
+            ("last_run_timestamp_seconds", time.time()),
+            ("last_run_duration_seconds", time.perf_counter() - self.start),
+            ("last_run_success", 1 if success else 0),
+        ):
+            metric = f"{PROMETHEUS_PREFIX}{name}"
+            describe(metric, name, "gauge")
+            lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path, prometheus_path, success=True, **run_info):
+        """
+        Writes the JSON run summary and the Prometheus textfile. Files are written to a
+        temporary file first and then renamed so readers never see a partial file.
+        """
+        summary = self.summary(success=success, **run_info)
+        if json_path:
+            self._write_atomic(json_path, json.dumps(summary, indent=2, default=str))
+        if prometheus_path:
+            self._write_atomic(prometheus_path, self.prometheus_text(success))
+        return summary
+
+    def _write_atomic(self, path, text):
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_name(f".{path.name}.tmp")
+        temporary_path.write_text(text)
+        os.replace(temporary_path, path)
+
+    def _key(self, name, labels):
+        # Label values are kept as strings so keys always sort
+        return name, tuple(
+            sorted((label, str(value)) for label, value in labels.items())
+        )
+
+    def _labels(self, labels):
+        if not labels:
+            return ""
+        formatted = ",".join(
+            f'{name}="{self._escape(value)}"' for name, value in labels
+        )
+        return f"{{{formatted}}}"
+
+    def _escape(self, value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Metrics of the current process, used by every module
+metrics = Metrics()
@@ -0,0 +1,132 @@
+import json
+import pathlib
+import sqlite3
+import threading
+import zlib
+from datetime import datetime, timedelta
+from config import order_cache_config
+
+
+class OrderCache:
+    """
+    Local SQLite cache of the SellerCloud orders, keyed by channel and ship date.
+    Orders are stored as slimmed by order_lines.slim_order.
+
+    Every entry holds all the orders shipped on one day for one channel. A day that was
+    fetched less than settle_hours after it ended can still receive orders, so it is only
+    reused for recent_ttl_minutes. Days fetched after they settled are reused for
+    ttl_days.
+    """
+
+    date_format = "%m/%d/%Y %H:%M:%S"
+
+    def __init__(self, path=None):
+        self.path = pathlib.Path(path or order_cache_config["path"])
+        self.settle = timedelta(hours=order_cache_config["settle_hours"])
+        self.recent_ttl = timedelta(minutes=order_cache_config["recent_ttl_minutes"])
+        self.ttl = timedelta(days=order_cache_config["ttl_days"])
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            "channel TEXT NOT NULL, "
+            "ship_date TEXT NOT NULL, "
+            "fetched_at TEXT NOT NULL, "
+            "orders BLOB NOT NULL, "
+            "PRIMARY KEY (channel, ship_date))"
+        )
+        self.conn.commit()
+
+    def split_days(self, from_date, to_date):
+        """
+        Splits a SellerCloud date range into the days it covers.
+
+        Returns None if the range does not start and end on day boundaries, those
+        ranges are not cached.
+        """
+        first = datetime.strptime(from_date, self.date_format)
+        last = datetime.strptime(to_date, self.date_format)
+        if (
+            first.time() != datetime.min.time()
+            or last.strftime("%H:%M:%S") != "23:59:59"
+        ):
+            return None
+
+        days = []
+        day = first.date()
+        while day <= last.date():
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def day_range(self, day):
+        """Returns the SellerCloud date range covering a single day."""
+        return day.strftime("%m/%d/%Y 00:00:00"), day.strftime("%m/%d/%Y 23:59:59")
+
+    def get(self, channel, day):
+        """Returns the cached orders for the channel and day, or None if missing or stale."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT fetched_at, orders FROM orders WHERE channel = ? AND ship_date = ?",
+                (channel, day.isoformat()),
+            ).fetchone()
+        if row is None:
+            return None
+
+        fetched_at = datetime.fromisoformat(row[0])
+        if not self._is_fresh(day, fetched_at):
+            return None
+        return json.loads(zlib.decompress(row[1]))
+
+    def has(self, channel, day):
+        """Returns whether fresh orders are cached for the channel and day."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT fetched_at FROM orders WHERE channel = ? AND ship_date = ?",
+                (channel, day.isoformat()),
+            ).fetchone()
+        return row is not None and self._is_fresh(day, datetime.fromisoformat(row[0]))
+
+    def put(self, channel, day, orders):
+        """Stores the orders for the channel and day, replacing any previous entry."""
+        blob = zlib.compress(json.dumps(orders).encode("utf-8"))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO orders (channel, ship_date, fetched_at, orders) "
+                "VALUES (?, ?, ?, ?)",
+                (channel, day.isoformat(), datetime.now().isoformat(), blob),
+            )
+            self.conn.commit()
+
+    def invalidate(self, channel=None, from_day=None, to_day=None):
+        """
+        Removes cached days. Every argument narrows down what is removed, calling it
+        without arguments clears the whole cache.
+        """
+        clauses = []
+        params = []
+        if channel is not None:
+            clauses.append("channel = ?")
+            params.append(channel)
+        if from_day is not None:
+            clauses.append("ship_date >= ?")
+            params.append(from_day.isoformat())
+        if to_day is not None:
+            clauses.append("ship_date <= ?")
+            params.append(to_day.isoformat())
+
+        query = "DELETE FROM orders"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        with self.lock:
+            self.conn.execute(query, params)
+            self.conn.commit()
+
+    def _is_fresh(self, day, fetched_at):
+        day_end = datetime.combine(day, datetime.max.time())
+        age = datetime.now() - fetched_at
+        if fetched_at - day_end >= self.settle:
+            return age <= self.ttl
+        return age <= self.recent_ttl
@@ -0,0 +1,84 @@
+import sys
+from array import array
+
+# Fields of the SellerCloud orders used by the journal reports. Everything else the API
+# returns is dropped as soon as a page arrives.
+ORDER_FIELDS = ("ID", "OrderSourceOrderID", "ShipDate")
+ITEM_FIELDS = ("ProductIDOriginal", "AverageCost", "Qty")
+
+
+def intern_string(value):
+    """Interns strings so repeated values, like SKUs, share a single object."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def slim_order(order):
+    """Returns a copy of a SellerCloud order with only the fields the job uses."""
+    slim = {field: order[field] for field in ORDER_FIELDS}
+    slim["Items"] = [
+        {
+            "ProductIDOriginal": intern_string(item["ProductIDOriginal"]),
+            "AverageCost": item["AverageCost"],
+            "Qty": item["Qty"],
+        }
+        for item in order["Items"]
+    ]
+    return slim
+
+
+class OrderLines:
+    """
+    Item lines of a batch of orders stored column by column.
+
+    Order fields are kept once per order and every line points at its order by index.
+    Costs, quantities and order indexes are packed in typed arrays and SKUs are
+    interned, so a line takes a few dozen bytes instead of a dictionary of its own.
+    """
+
+    __slots__ = (
+        "order_ids",
+        "purchase_order_numbers",
+        "ship_dates",
+        "line_orders",
+        "skus",
+        "item_costs",
+        "qtys",
+    )
+
+    def __init__(self):
+        self.order_ids = []
+        self.purchase_order_numbers = []
+        self.ship_dates = []
+        self.line_orders = array("q")
+        self.skus = []
+        self.item_costs = array("d")
+        self.qtys = array("q")
+
+    @classmethod
+    def from_orders(cls, orders):
+        lines = cls()
+        lines.extend(orders)
+        return lines
+
+    def extend(self, orders):
+        """Adds the item lines of SellerCloud orders, full or slimmed."""
+        # Bound methods are looked up once, this loop runs for every item line
+        add_line_order = self.line_orders.append
+        add_sku = self.skus.append
+        add_item_cost = self.item_costs.append
+        add_qty = self.qtys.append
+        for order in orders:
+            order_index = len(self.order_ids)
+            self.order_ids.append(order["ID"])
+            self.purchase_order_numbers.append(order["OrderSourceOrderID"])
+            self.ship_dates.append(order["ShipDate"])
+            for item in order["Items"]:
+                add_line_order(order_index)
+                add_sku(intern_string(item["ProductIDOriginal"]))
+                add_item_cost(item["AverageCost"])
+                add_qty(item["Qty"])
+
+    def __len__(self):
+        return len(self.order_ids)
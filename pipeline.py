@@ -0,0 +1,218 @@
+import queue
+import threading
+from config import pipeline_config
+
+# Marks the end of the items in a queue
+_DONE = object()
+
+# How often, in seconds, blocked threads check whether the pipeline is stopping
+_POLL_SECONDS = 0.1
+
+
+class _Failure:
+    """Carries an error raised by a prefetch producer to its consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages connected by bounded queues.
+
+    Every stage has its own worker threads and hands its outputs to the next stage as
+    soon as they are ready, so different items are in different stages at the same
+    time. A stage blocks when the queue of the next one is full. When a stage raises,
+    every stage stops taking items and run() raises the error once all threads ended.
+    """
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or pipeline_config["queue_size"]
+        self.stages = []
+        self.stopping = threading.Event()
+        self.errors = []
+
+    def add_stage(self, name, function, workers=1, batch_size=None):
+        """
+        Adds a stage. function is called with every item and returns an iterable of
+        outputs for the next stage. With batch_size it is called instead with a list of
+        the items waiting, at most batch_size of them.
+        """
+        self.stages.append(
+            {
+                "name": name,
+                "function": function,
+                "workers": workers,
+                "batch_size": batch_size,
+            }
+        )
+        return self
+
+    def run(self, items):
+        """Feeds items through the stages and returns the outputs of the last one."""
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        # The outputs of the last stage are only read at the end, so they are unbounded
+        queues.append(queue.Queue())
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            # The last worker of a stage to finish tells the next stage it is done
+            running = {"workers": stage["workers"], "lock": threading.Lock()}
+            for number in range(stage["workers"]):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[index], queues[index + 1], running),
+                    name=f"{stage['name']}-{number}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        for item in items:
+            if not self._put(queues[0], item):
+                break
+        self._put(queues[0], _DONE)
+
+        for thread in threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+        outputs = []
+        while not queues[-1].empty():
+            output = queues[-1].get()
+            if output is not _DONE:
+                outputs.append(output)
+        return outputs
+
+    def _work(self, stage, inputs, outputs, running):
+        try:
+            while not self.stopping.is_set():
+                batch = self._get(inputs, stage["batch_size"])
+                if batch is None:
+                    break
+                argument = batch if stage["batch_size"] else batch[0]
+                for output in stage["function"](argument) or ():
+                    if not self._put(outputs, output):
+                        return
+        except Exception as e:
+            print(f"Pipeline stage {stage['name']} failed: {e}")
+            self.errors.append(e)
+            self.stopping.set()
+        finally:
+            with running["lock"]:
+                running["workers"] -= 1
+                last = running["workers"] == 0
+            if last:
+                self._put(outputs, _DONE)
+
+    def _get(self, inputs, batch_size=None):
+        """
+        Returns a list with the next item, or with up to batch_size waiting items, or
+        None once the stage has no more items or the pipeline is stopping.
+        """
+        while True:
+            try:
+                item = inputs.get(timeout=_POLL_SECONDS)
+                break
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return None
+        if item is _DONE:
+            # Left in the queue for the other workers of the stage
+            inputs.put(_DONE)
+            return None
+
+        batch = [item]
+        while batch_size and len(batch) < batch_size:
+            try:
+                item = inputs.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                inputs.put(_DONE)
+                break
+            batch.append(item)
+        return batch
+
+    def _put(self, outputs, item):
+        """Waits for room in the queue. Returns False if the pipeline is stopping."""
+        while True:
+            try:
+                outputs.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                if self.stopping.is_set():
+                    return False
+
+
+def prefetch(iterable, size=None):
+    """
+    Iterates over iterable in a background thread, started right away, keeping up to
+    size items ready in a bounded queue, page_queue_size by default. Errors of the
+    producer are raised to the consumer, and closing the returned iterator stops the
+    producer, even when it was never iterated.
+    """
+    return _Prefetch(iterable, size or pipeline_config["page_queue_size"])
+
+
+class _Prefetch:
+    """Iterator returned by prefetch."""
+
+    def __init__(self, iterable, size):
+        self.items = queue.Queue(size)
+        self.stopping = threading.Event()
+        # The producer does not reference the iterator, so dropping it stops the producer
+        self.producer = threading.Thread(
+            target=_produce,
+            args=(iterable, self.items, self.stopping),
+            name="prefetch",
+            daemon=True,
+        )
+        self.producer.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.stopping.is_set():
+            raise StopIteration
+        item = self.items.get()
+        if item is _DONE:
+            self.close()
+            raise StopIteration
+        if isinstance(item, _Failure):
+            self.close()
+            raise item.error
+        return item
+
+    def close(self):
+        self.stopping.set()
+        if self.producer is not threading.current_thread():
+            self.producer.join()
+
+    def __del__(self):
+        self.close()
+
+
+def _produce(iterable, items, stopping):
+    def put(item):
+        while not stopping.is_set():
+            try:
+                items.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for item in iterable:
+            if not put(item):
+                return
+        put(_DONE)
+    except Exception as e:
+        put(_Failure(e))
+    finally:
+        close = getattr(iterable, "close", None)
+        if close:
+            close()
@@ -1,4 +1,4 @@
-from config import client_data, ref_id_map
+from config import client_data, ref_id_map, qb_ref_cache_config, qb_batch_config
 from intuitlib.client import AuthClient
 from quickbooks import QuickBooks
 from quickbooks.objects import (
@@ -12,13 +12,33 @@ from quickbooks.objects import (
     AttachableRef,
     Customer,
 )
-from datetime import datetime
+from quickbooks.objects.base import Ref
+from quickbooks.batch import BatchManager
+from quickbooks.objects.batchrequest import BatchOperation
+from decimal_rounding import cents_to_amount, amount_to_cents
+from metrics import metrics
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+import json
 import os
+import pathlib
+import threading
+import time
+
+CREDIT_ACCOUNT_ID = 29
+COST_ACCOUNT_ID = 46
+
+# QuickBooks access tokens last one hour, used when the auth client does not say
+ACCESS_TOKEN_TTL_SECONDS = 3600
 
 
 class QbAPI:
-    def __init__(self, current_refresh_token):
-        self.auth_client = AuthClient(
+    def __init__(self, current_refresh_token, auth_client=None):
+        """
+        auth_client can be given to reuse an already authenticated client, otherwise a
+        new one is created from client_data.
+        """
+        self.auth_client = auth_client or AuthClient(
             client_id=client_data["client_id"],
             client_secret=client_data["client_secret"],
             environment=client_data["environment"],
@@ -29,72 +49,357 @@ class QbAPI:
             refresh_token=current_refresh_token,
             company_id=client_data["realm_id"],
         )
+        self._set_access_token_expiry()
+        if client_data.get("api_url"):
+            # Used to point the client at a local QuickBooks stand-in
+            self.client.api_url_v3 = client_data["api_url"]
+            self.client.sandbox_api_url_v3 = client_data["api_url"]
+        self._instrument_client()
+        self.refs = {}
+        self.refs_lock = threading.Lock()
+        self.journal_entry_ids = {}
+        # Totals, in cents, of the journal entries found by resolve_journal_entry_ids
+        self.journal_entry_cents = {}
+        self.warm_ref_cache()
 
-    def get_journal_entry_id(self, doc_name):
+    def refresh_access_token(self):
         """
-        Gets the ID of a QuickBooks journal entry by its document number (DocNumber).
+        Gets a new access token for the session. QuickBooks may also rotate the refresh
+        token, the current one is in client.refresh_token.
         """
+        self.auth_client.refresh(refresh_token=self.client.refresh_token)
+        # The client builds its session from the auth client's new tokens
+        self.client.refresh_token = self.client._start_session()
+        self._set_access_token_expiry()
+
+    def access_token_expires_in(self):
+        """Returns the number of seconds left before the access token expires."""
+        return self.access_token_expires_at - time.monotonic()
+
+    def _set_access_token_expiry(self):
+        expires_in = getattr(self.auth_client, "expires_in", None)
+        self.access_token_expires_at = time.monotonic() + float(
+            expires_in or ACCESS_TOKEN_TTL_SECONDS
+        )
+
+    def _instrument_client(self):
+        """Records the latency, status code and size of every QuickBooks request."""
+        process_request = self.client.process_request
+
+        def timed_process_request(request_type, url, headers="", params="", data=""):
+            operation = self._request_operation(url)
+            start = time.perf_counter()
+            try:
+                response = process_request(
+                    request_type, url, headers=headers, params=params, data=data
+                )
+            except Exception:
+                metrics.count(
+                    "quickbooks_requests", operation=operation, status="error"
+                )
+                raise
+            metrics.observe(
+                "quickbooks_request_seconds",
+                time.perf_counter() - start,
+                operation=operation,
+            )
+            metrics.count(
+                "quickbooks_requests", operation=operation, status=response.status_code
+            )
+            metrics.count(
+                "quickbooks_request_bytes", len(data or ""), operation=operation
+            )
+            return response
+
+        self.client.process_request = timed_process_request
+
+    def _request_operation(self, url):
+        """Gets the operation of a request url, like account, query or upload."""
+        parts = urlparse(url).path.strip("/").split("/")
+        if "company" in parts and parts.index("company") + 2 < len(parts):
+            return parts[parts.index("company") + 2].lower()
+        return parts[-1].lower()
+
+    def get_ref(self, object_class, object_id):
+        """
+        Returns the reference to a QuickBooks Account or Class.
+        Each reference is only looked up once per session.
+        """
+        key = f"{object_class.qbo_object_name}:{object_id}"
+        with self.refs_lock:
+            ref = self.refs.get(key)
+        if ref is None:
+            ref = object_class.get(object_id, qb=self.client).to_ref()
+            with self.refs_lock:
+                self.refs[key] = ref
+        return ref
+
+    def warm_ref_cache(self):
+        """
+        Loads every reference used by the journal entries, from the disk cache when it
+        is still valid and from QuickBooks otherwise.
+        """
+        if self._load_ref_cache():
+            return
+
+        self.get_ref(Account, CREDIT_ACCOUNT_ID)
+        self.get_ref(Account, COST_ACCOUNT_ID)
+        for channel_refs in ref_id_map.values():
+            self.get_ref(Class, channel_refs["class_ref_id"])
+        self._save_ref_cache()
+
+    def _load_ref_cache(self):
+        path = pathlib.Path(qb_ref_cache_config["path"])
+        if not qb_ref_cache_config["persist"] or not path.exists():
+            return False
+
         try:
-            if JournalEntry.filter(DocNumber=doc_name, qb=self.client):
-                return JournalEntry.filter(DocNumber=doc_name, qb=self.client)[0].Id
-            else:
+            cache = json.loads(path.read_text())
+            cached_at = datetime.fromisoformat(cache["cached_at"])
+            ttl = timedelta(hours=qb_ref_cache_config["ttl_hours"])
+            if cache["realm_id"] != client_data["realm_id"]:
                 return False
+            if datetime.now() - cached_at > ttl:
+                return False
+
+            refs = {}
+            for key, values in cache["refs"].items():
+                ref = Ref()
+                ref.value = values["value"]
+                ref.name = values["name"]
+                ref.type = values["type"]
+                refs[key] = ref
         except Exception as e:
-            print(
-                f"There was an error checking if PO: {doc_name} was already invoiced: {e}"
-            )
+            print(f"Could not read the QuickBooks reference cache: {e}")
             return False
 
-    def create_journal_entry(self, amount, channel, to_date):
+        with self.refs_lock:
+            self.refs.update(refs)
+        return True
+
+    def _save_ref_cache(self):
+        if not qb_ref_cache_config["persist"]:
+            return
+
+        with self.refs_lock:
+            refs = {
+                key: {"value": ref.value, "name": ref.name, "type": ref.type}
+                for key, ref in self.refs.items()
+            }
+        cache = {
+            "realm_id": client_data["realm_id"],
+            "cached_at": datetime.now().isoformat(),
+            "refs": refs,
+        }
+        try:
+            path = pathlib.Path(qb_ref_cache_config["path"])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(cache))
+        except Exception as e:
+            print(f"Could not write the QuickBooks reference cache: {e}")
+
+    def get_journal_entry_id(self, doc_name):
         """
-        Creates a journal entry in QuickBooks for a specific channel.
+        Gets the ID of a QuickBooks journal entry by its document number (DocNumber).
         """
-        try:
-            # Creating credit line
-            credit_line_detail = JournalEntryLineDetail()
-            credit_line_detail.AccountRef = Account.get(29, qb=self.client).to_ref()
-            credit_line_detail.PostingType = "Credit"
-            credit_line_detail.TaxApplicableOn = "Sales"
+        journal_entry_id = self.resolve_journal_entry_ids([doc_name]).get(doc_name)
+        return journal_entry_id or False
 
-            credit_line = JournalEntryLine()
-            credit_line.Amount = amount
-            credit_line.JournalEntryLineDetail = credit_line_detail
+    def resolve_journal_entry_ids(self, doc_names):
+        """
+        Gets the IDs of several QuickBooks journal entries by their document numbers.
 
-            # Creating cost line
-            cost_line_detail = JournalEntryLineDetail()
-            cost_line_detail.AccountRef = Account.get(46, qb=self.client).to_ref()
-            cost_line_detail.ClassRef = Class.get(
-                ref_id_map[channel]["class_ref_id"], qb=self.client
-            ).to_ref()
-            cost_line_detail.PostingType = "Debit"
-            cost_line_detail.TaxApplicableOn = "Sales"
+        Document numbers that were created or looked up during this session are
+        answered from memory, the rest are looked up with a single query. Returns a
+        dictionary of DocNumber to Id for the journal entries that exist.
+        """
+        missing = [
+            doc_name
+            for doc_name in dict.fromkeys(doc_names)
+            if doc_name not in self.journal_entry_ids
+        ]
+        if missing:
+            try:
+                with metrics.span("resolve_id"):
+                    journal_entries = JournalEntry.choose(
+                        missing, field="DocNumber", qb=self.client
+                    )
+                for journal_entry in journal_entries:
+                    self.journal_entry_ids.setdefault(
+                        journal_entry.DocNumber, journal_entry.Id
+                    )
+                    if getattr(journal_entry, "TotalAmt", None) is not None:
+                        self.journal_entry_cents.setdefault(
+                            journal_entry.DocNumber,
+                            amount_to_cents(journal_entry.TotalAmt),
+                        )
+            except Exception as e:
+                print(
+                    f"There was an error checking if journal entries {', '.join(missing)} exist: {e}"
+                )
 
-            cost_line = JournalEntryLine()
-            cost_line.Amount = amount
-            cost_line.JournalEntryLineDetail = cost_line_detail
+        return {
+            doc_name: self.journal_entry_ids[doc_name]
+            for doc_name in doc_names
+            if doc_name in self.journal_entry_ids
+        }
 
-            # Creating journal entry
-            date = to_date[:10]
-            date = datetime.strptime(date, "%m/%d/%Y")
-            date_for_doc_name = date.strftime("%m%d%Y")
-            journal_entry = JournalEntry()
-            journal_entry.DocNumber = f"{channel}_COG_{date_for_doc_name}_SC"
-            journal_entry.TxnDate = date.strftime("%Y-%m-%d")
-            journal_entry.Line = [credit_line, cost_line]
+    def get_journal_entry_cents(self, doc_name):
+        """
+        Returns the total in cents of a journal entry that resolve_journal_entry_ids
+        found in QuickBooks, or None if it is not known.
+        """
+        return self.journal_entry_cents.get(doc_name)
+
+    def journal_entry_doc_number(self, channel, to_date):
+        """Builds the document number of a channel journal entry."""
+        date = datetime.strptime(to_date[:10], "%m/%d/%Y")
+        return f"{channel}_COG_{date.strftime('%m%d%Y')}_SC"
+
+    def combined_journal_entry_doc_number(self, to_date):
+        """Builds the document number of the combined journal entry."""
+        date = datetime.strptime(to_date[:10], "%m/%d/%Y")
+        return f"COG_{date.strftime('%b%d').upper()}_SC"
 
-            journal_entry.save(qb=self.client)
+    def create_journal_entry(self, cents, channel, to_date, doc_number=None):
+        """
+        Creates a journal entry in QuickBooks for a specific channel.
+        The amount is given in integer cents. doc_number defaults to the channel's
+        journal_entry_doc_number, adjustments pass their own.
+        """
+        try:
+            journal_entry = self.build_journal_entry(
+                cents, channel, to_date, doc_number
+            )
+            with metrics.span("post"):
+                journal_entry.save(qb=self.client)
+            self.journal_entry_ids[journal_entry.DocNumber] = journal_entry.Id
             return journal_entry.DocNumber
 
         except Exception as e:
             print(f"Error while creating journal entry: {e}")
 
+    def build_journal_entry(self, cents, channel, to_date, doc_number=None):
+        """
+        Builds, without saving, the journal entry of a specific channel.
+        The amount is given in integer cents. A negative amount, from an adjustment
+        that lowers the cost of a period, is posted with the debit and credit sides
+        swapped since QuickBooks lines cannot be negative.
+        """
+        amount = cents_to_amount(abs(cents))
+        credit_posting_type, cost_posting_type = "Credit", "Debit"
+        if cents < 0:
+            credit_posting_type, cost_posting_type = "Debit", "Credit"
+
+        # Creating credit line
+        credit_line_detail = JournalEntryLineDetail()
+        credit_line_detail.AccountRef = self.get_ref(Account, CREDIT_ACCOUNT_ID)
+        credit_line_detail.PostingType = credit_posting_type
+        credit_line_detail.TaxApplicableOn = "Sales"
+
+        credit_line = JournalEntryLine()
+        credit_line.Amount = amount
+        credit_line.JournalEntryLineDetail = credit_line_detail
+
+        # Creating cost line
+        cost_line_detail = JournalEntryLineDetail()
+        cost_line_detail.AccountRef = self.get_ref(Account, COST_ACCOUNT_ID)
+        cost_line_detail.ClassRef = self.get_ref(
+            Class, ref_id_map[channel]["class_ref_id"]
+        )
+        cost_line_detail.PostingType = cost_posting_type
+        cost_line_detail.TaxApplicableOn = "Sales"
+
+        cost_line = JournalEntryLine()
+        cost_line.Amount = amount
+        cost_line.JournalEntryLineDetail = cost_line_detail
+
+        # Creating journal entry
+        date = datetime.strptime(to_date[:10], "%m/%d/%Y")
+        journal_entry = JournalEntry()
+        journal_entry.DocNumber = doc_number or self.journal_entry_doc_number(
+            channel, to_date
+        )
+        journal_entry.TxnDate = date.strftime("%Y-%m-%d")
+        journal_entry.Line = [credit_line, cost_line]
+
+        return journal_entry
+
+    def batch_create_journal_entries(self, entries):
+        """
+        Creates channel journal entries through the QuickBooks batch endpoint.
+
+        The entries are sent in chunks of qb_batch_config["max_items"], one request
+        per chunk.
+
+        :param entries: List of (cents, channel, to_date) tuples, or (cents, channel,
+            to_date, doc_number) tuples for entries with their own DocNumber.
+        :return: Dictionary of DocNumber to a dictionary with the channel, the to_date,
+            the status ("created" or "failed"), the Id and the error message.
+        """
+        results = {}
+        journal_entries = []
+        for cents, channel, to_date, *custom_doc_number in entries:
+            doc_number = (
+                custom_doc_number[0]
+                if custom_doc_number and custom_doc_number[0]
+                else self.journal_entry_doc_number(channel, to_date)
+            )
+            results[doc_number] = {
+                "channel": channel,
+                "to_date": to_date,
+                "status": "failed",
+                "id": None,
+                "error": None,
+            }
+            try:
+                journal_entries.append(
+                    self.build_journal_entry(cents, channel, to_date, doc_number)
+                )
+            except Exception as e:
+                results[doc_number]["error"] = str(e)
+
+        batch_manager = BatchManager(BatchOperation.CREATE)
+        chunk_size = qb_batch_config["max_items"]
+        for start in range(0, len(journal_entries), chunk_size):
+            batch = batch_manager.list_to_batch_request(
+                journal_entries[start : start + chunk_size]
+            )
+            doc_numbers = {
+                item.bId: item.get_object().DocNumber for item in batch.BatchItemRequest
+            }
+
+            try:
+                with metrics.span("post"):
+                    response = self.client.batch_operation(batch.to_json())
+            except Exception as e:
+                print(f"Error while creating journal entries in batch: {e}")
+                for doc_number in doc_numbers.values():
+                    results[doc_number]["error"] = str(e)
+                continue
+
+            for item in response["BatchItemResponse"]:
+                result = results[doc_numbers[item["bId"]]]
+                if "Fault" in item:
+                    result["error"] = "; ".join(
+                        error.get("Detail") or error.get("Message", "")
+                        for error in item["Fault"]["Error"]
+                    )
+                else:
+                    result["status"] = "created"
+                    result["id"] = item["JournalEntry"]["Id"]
+                    self.journal_entry_ids[doc_numbers[item["bId"]]] = result["id"]
+
+        return results
+
     def create_combined_journal_entry(self, channel_amounts_and_report, to_date):
         """
         Creates a combined journal entry in QuickBooks for all channels.
+        Channel amounts are given in integer cents under "channel_cents".
         """
         try:
-            total_amount = sum(
-                amount["channel_amount"]
+            total_cents = sum(
+                amount["channel_cents"]
                 for amount in channel_amounts_and_report.values()
             )
 
@@ -102,41 +407,42 @@ class QbAPI:
 
             # Creating credit line
             credit_line_detail = JournalEntryLineDetail()
-            credit_line_detail.AccountRef = Account.get(29, qb=self.client).to_ref()
+            credit_line_detail.AccountRef = self.get_ref(Account, CREDIT_ACCOUNT_ID)
             credit_line_detail.PostingType = "Credit"
             credit_line_detail.TaxApplicableOn = "Sales"
 
             credit_line = JournalEntryLine()
-            credit_line.Amount = total_amount
+            credit_line.Amount = cents_to_amount(total_cents)
             credit_line.JournalEntryLineDetail = credit_line_detail
             lines.append(credit_line)
 
             for channel, amount in channel_amounts_and_report.items():
                 # Creating cost line
                 cost_line_detail = JournalEntryLineDetail()
-                cost_line_detail.AccountRef = Account.get(46, qb=self.client).to_ref()
-                cost_line_detail.ClassRef = Class.get(
-                    ref_id_map[channel]["class_ref_id"], qb=self.client
-                ).to_ref()
+                cost_line_detail.AccountRef = self.get_ref(Account, COST_ACCOUNT_ID)
+                cost_line_detail.ClassRef = self.get_ref(
+                    Class, ref_id_map[channel]["class_ref_id"]
+                )
                 cost_line_detail.PostingType = "Debit"
                 cost_line_detail.TaxApplicableOn = "Sales"
 
                 cost_line = JournalEntryLine()
-                cost_line.Amount = amount["channel_amount"]
+                cost_line.Amount = cents_to_amount(amount["channel_cents"])
                 cost_line.JournalEntryLineDetail = cost_line_detail
                 lines.append(cost_line)
 
             # Creating journal entry
-            date = datetime.strptime(to_date, "%m/%d/%Y")
-            date_for_doc_name = date.strftime("%b%d").upper()
+            date = datetime.strptime(to_date[:10], "%m/%d/%Y")
 
             journal_entry = JournalEntry()
-            journal_entry.DocNumber = f"COG_{date_for_doc_name}_SC"
+            journal_entry.DocNumber = self.combined_journal_entry_doc_number(to_date)
             # journal_entry.DocNumber = "test_journal"
             journal_entry.TxnDate = date.strftime("%Y-%m-%d")
             journal_entry.Line = lines
 
-            journal_entry.save(qb=self.client)
+            with metrics.span("post"):
+                journal_entry.save(qb=self.client)
+            self.journal_entry_ids[journal_entry.DocNumber] = journal_entry.Id
             return journal_entry.DocNumber
 
         except Exception as e:
@@ -147,30 +453,37 @@ class QbAPI:
         Attaches a file to a QuickBooks journal entry.
         """
         try:
-            file_name = os.path.basename(file_path)
-
-            attachment = Attachable()
-
-            attachable_ref = AttachableRef()
-            attachable_ref.EntityRef = {
-                "type": "JournalEntry",  # The type of the entity being referenced
-                "value": journal_entry_id,  # The ID of the journal entry
-            }
-            attachment.AttachableRef.append(attachable_ref)
-
-            attachment.FileName = file_name
-            attachment._FilePath = file_path
-            attachment.ContentType = (
-                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-            attachment.save(qb=self.client)
-
+            self.upload_attachment(file_path, journal_entry_id)
             return True
 
         except Exception as e:
             print(f"Error while attaching file to journal entry: {e}")
             return False
 
+    def upload_attachment(self, file_path, journal_entry_id):
+        """
+        Uploads a file as an attachment of a QuickBooks journal entry.
+        Unlike attach_file_to_journal_entry, errors are raised to the caller.
+        """
+        file_name = os.path.basename(file_path)
+
+        attachment = Attachable()
+
+        attachable_ref = AttachableRef()
+        attachable_ref.EntityRef = {
+            "type": "JournalEntry",  # The type of the entity being referenced
+            "value": journal_entry_id,  # The ID of the journal entry
+        }
+        attachment.AttachableRef.append(attachable_ref)
+
+        attachment.FileName = file_name
+        attachment._FilePath = file_path
+        attachment.ContentType = (
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+        with metrics.span("attach"):
+            attachment.save(qb=self.client)
+
     def delete_journal_entry(self, txn_id):
         """
         Deletes a QuickBooks journal entry by its transaction ID (TxnId).
@@ -194,3 +507,72 @@ class QbAPI:
         except Exception as e:
             print(f"Failed to delete journal entry with TxnId {txn_id}: {e}")
             return False
+
+
+class DryRunQbAPI(QbAPI):
+    """
+    Stand-in for QbAPI that records the journal entries a run would post instead of
+    posting them. It never connects to QuickBooks, replays use it.
+    """
+
+    def __init__(self):
+        self.journal_entry_ids = {}
+        self.journal_entry_cents = {}
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def resolve_journal_entry_ids(self, doc_names):
+        return {
+            doc_name: self.journal_entry_ids[doc_name]
+            for doc_name in doc_names
+            if doc_name in self.journal_entry_ids
+        }
+
+    def get_journal_entry_id(self, doc_name):
+        return self.journal_entry_ids.get(doc_name, False)
+
+    def create_journal_entry(self, cents, channel, to_date, doc_number=None):
+        doc_number = doc_number or self.journal_entry_doc_number(channel, to_date)
+        self._record(doc_number, {channel: cents}, to_date)
+        return doc_number
+
+    def batch_create_journal_entries(self, entries):
+        results = {}
+        for cents, channel, to_date, *custom_doc_number in entries:
+            doc_number = self.create_journal_entry(
+                cents, channel, to_date, *custom_doc_number
+            )
+            results[doc_number] = {
+                "channel": channel,
+                "to_date": to_date,
+                "status": "created",
+                "id": self.journal_entry_ids[doc_number],
+                "error": None,
+            }
+        return results
+
+    def create_combined_journal_entry(self, channel_amounts_and_report, to_date):
+        doc_number = self.combined_journal_entry_doc_number(to_date)
+        self._record(
+            doc_number,
+            {
+                channel: amount["channel_cents"]
+                for channel, amount in channel_amounts_and_report.items()
+            },
+            to_date,
+        )
+        return doc_number
+
+    def upload_attachment(self, file_path, journal_entry_id):
+        print(f"Dry run, not attaching {file_path}")
+
+    def _record(self, doc_number, channel_cents, to_date):
+        amounts = {
+            channel: cents_to_amount(cents) for channel, cents in channel_cents.items()
+        }
+        print(f"Dry run, journal entry {doc_number} not posted: {amounts}")
+        with self.lock:
+            self.journal_entry_ids[doc_number] = f"dry-run-{len(self.entries) + 1}"
+            self.entries.append(
+                {"doc_number": doc_number, "to_date": to_date, "amounts": amounts}
+            )
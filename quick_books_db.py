@@ -1,10 +1,12 @@
 import pyodbc
-from config import create_connection_string, db_config
+from config import create_connection_string, db_config, client_data
 
 
 class QuickBooksDb:
     def __init__(self):
-        self.conn = pyodbc.connect(create_connection_string(db_config["QbExampleDb"]))
+        self.conn = pyodbc.connect(
+            create_connection_string(db_config[client_data["token_db"]])
+        )
         self.cursor = self.conn.cursor()
 
     def get_refresh_token(self):
@@ -12,7 +14,9 @@ class QuickBooksDb:
         return self.cursor.fetchone()[0]
 
     def update_refresh_token(self, refresh_token):
-        conn = pyodbc.connect(create_connection_string(db_config["QbExampleDb"]))
+        conn = pyodbc.connect(
+            create_connection_string(db_config[client_data["token_db"]])
+        )
         cursor = conn.cursor()
         cursor.execute("INSERT INTO keys (refresh_token) VALUES (?)", refresh_token)
         conn.commit()
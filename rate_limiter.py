@@ -0,0 +1,192 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to capacity."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Waits for a token and returns the number of seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class AdaptiveConcurrency:
+    """
+    Limits the number of requests in flight and adapts the limit to the endpoint.
+
+    The limit grows by one after a full limit's worth of fast successful requests and
+    is halved on throttling or server errors. It also shrinks by one when the average
+    latency goes above target_latency. Decreases happen at most once per cooldown so a
+    burst of failures from requests already in flight only counts once.
+    """
+
+    def __init__(self, maximum, minimum=1, target_latency=5.0, cooldown=1.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = maximum
+        self.target_latency = target_latency
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.successes = 0
+        self.latency = None
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def record_success(self, latency):
+        with self.condition:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = 0.8 * self.latency + 0.2 * latency
+
+            if self.latency > self.target_latency:
+                self._decrease(self.limit - 1)
+                return
+
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify()
+
+    def record_failure(self):
+        with self.condition:
+            self._decrease(self.limit // 2)
+
+    def _decrease(self, limit):
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.limit = max(self.minimum, limit)
+        self.successes = 0
+
+
+class EndpointLimiter:
+    """Token bucket, adaptive concurrency and counters of a single endpoint."""
+
+    def __init__(self, requests_per_second, burst, max_concurrency, target_latency):
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.concurrency = AdaptiveConcurrency(
+            max_concurrency, target_latency=target_latency
+        )
+        self.lock = threading.Lock()
+        self.counters = {
+            "requests": 0,
+            "retries": 0,
+            "throttled": 0,
+            "server_errors": 0,
+            "connection_errors": 0,
+            "reauthentications": 0,
+            "throttle_wait_seconds": 0.0,
+            "backoff_wait_seconds": 0.0,
+        }
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["concurrency_limit"] = self.concurrency.limit
+        stats["average_latency_seconds"] = self.concurrency.latency
+        return stats
+
+
+class RateLimiter:
+    """
+    Shared rate limiter for every endpoint of an API.
+
+    limits maps endpoint names to their requests_per_second, burst and
+    max_concurrency, the "default" entry is used for endpoints not listed.
+    """
+
+    def __init__(self, limits, target_latency, backoff_seconds, max_backoff_seconds):
+        self.limits = limits
+        self.target_latency = target_latency
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def endpoint(self, name):
+        with self.lock:
+            limiter = self.endpoints.get(name)
+            if limiter is None:
+                limits = {**self.limits["default"], **self.limits.get(name, {})}
+                limiter = EndpointLimiter(
+                    limits["requests_per_second"],
+                    limits["burst"],
+                    limits["max_concurrency"],
+                    self.target_latency,
+                )
+                self.endpoints[name] = limiter
+            return limiter
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Returns how long to wait before the next attempt. Retry-After is honoured when
+        given, otherwise an exponential backoff with full jitter is used.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff_seconds)
+        ceiling = min(self.max_backoff_seconds, self.backoff_seconds * 2**attempt)
+        return random.uniform(0, ceiling)
+
+    def parse_retry_after(self, value):
+        """Parses a Retry-After header, in seconds or as an HTTP date."""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def stats(self):
+        """Returns the counters of every endpoint used so far."""
+        with self.lock:
+            endpoints = dict(self.endpoints)
+        return {name: limiter.stats() for name, limiter in endpoints.items()}
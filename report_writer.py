@@ -0,0 +1,120 @@
+import gzip
+import os
+
+
+class XlsxReportWriter:
+    """
+    Writes a report to an xlsx file using openpyxl's write-only mode.
+    Rows are streamed to disk as they are written, so memory use stays constant.
+    """
+
+    extension = "xlsx"
+
+    def __init__(self, file_path, sheet_name="Sheet1"):
+        from openpyxl import Workbook
+
+        self.file_path = file_path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(sheet_name)
+        self.header_written = False
+
+    def write(self, frame):
+        if not self.header_written:
+            self.sheet.append(list(frame.columns))
+            self.header_written = True
+        for row in frame.itertuples(index=False, name=None):
+            self.sheet.append(row)
+
+    def add_sheet(self, sheet_name, frame):
+        """Adds a sheet with all the rows of a DataFrame, e.g. a summary of the report."""
+        sheet = self.workbook.create_sheet(sheet_name)
+        sheet.append(list(frame.columns))
+        for row in frame.itertuples(index=False, name=None):
+            sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.file_path)
+
+    def abort(self):
+        """Drops the report, removing the file if it was already saved."""
+        # Closing the sheets ends their row streams, openpyxl removes the temporary
+        # files at exit
+        for sheet in self.workbook.worksheets:
+            if not sheet.closed:
+                sheet.close()
+        _remove(self.file_path)
+
+
+class CsvGzReportWriter:
+    """Writes a report to a gzip compressed csv file."""
+
+    extension = "csv.gz"
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = gzip.open(file_path, "wt", newline="")
+        self.header_written = False
+
+    def write(self, frame):
+        frame.to_csv(self.file, header=not self.header_written, index=False)
+        self.header_written = True
+
+    def close(self):
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+        _remove(self.file_path)
+
+
+class ParquetReportWriter:
+    """
+    Writes a report to a parquet file, one row group per chunk.
+    Needs pyarrow, which is only imported when a parquet report is requested.
+    """
+
+    extension = "parquet"
+
+    def __init__(self, file_path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("pyarrow is needed to write parquet reports") from e
+
+        self.pyarrow = pyarrow
+        self.file_path = file_path
+        self.writer = None
+        self.schema = None
+
+    def write(self, frame):
+        table = self.pyarrow.Table.from_pandas(
+            frame, schema=self.schema, preserve_index=False
+        )
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = self.pyarrow.parquet.ParquetWriter(
+                self.file_path, self.schema
+            )
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def abort(self):
+        self.close()
+        _remove(self.file_path)
+
+
+def _remove(file_path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+report_writers = {
+    writer.extension: writer
+    for writer in (XlsxReportWriter, CsvGzReportWriter, ParquetReportWriter)
+}
@@ -0,0 +1,161 @@
+import gzip
+import json
+import pathlib
+import shutil
+import threading
+from datetime import datetime
+from order_lines import slim_order
+from config import archive_config
+
+
+class ResponseArchive:
+    """
+    Archive of the SellerCloud order pages of a run, used to replay it offline.
+
+    Every page is appended to responses.ndjson.gz as a JSON line with the endpoint,
+    channel, window, page and the raw response. Each line is its own gzip member, so
+    the file reads with zcat and a single page can be read by seeking to its offset.
+    index.ndjson lists the pages with their offset and length as they are written, and
+    run.json the periods of the run with the settings they ran with.
+    """
+
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        self.name = self.directory.name
+        self.responses_path = self.directory / "responses.ndjson.gz"
+        self.index_path = self.directory / "index.ndjson"
+        self.run_path = self.directory / "run.json"
+        self.lock = threading.Lock()
+        self.run = {"periods": []}
+        self.index = []
+
+    @classmethod
+    def create(cls, **run_info):
+        """
+        Starts the archive of a new run in a directory named after the current time,
+        removing the oldest archives beyond keep_runs.
+        """
+        root = pathlib.Path(archive_config["directory"])
+        root.mkdir(parents=True, exist_ok=True)
+        old_runs = sorted(path for path in root.iterdir() if path.is_dir())
+        for path in old_runs[: max(len(old_runs) - archive_config["keep_runs"] + 1, 0)]:
+            shutil.rmtree(path, ignore_errors=True)
+
+        name = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        archive = cls(root / name)
+        archive.directory.mkdir()
+        archive.run = {
+            "started_at": datetime.now().isoformat(),
+            "run": run_info,
+            "periods": [],
+        }
+        archive._write_run()
+        return archive
+
+    @classmethod
+    def open(cls, directory):
+        """Opens an archived run for reading."""
+        archive = cls(directory)
+        archive.run = json.loads(archive.run_path.read_text())
+        if archive.index_path.exists():
+            with open(archive.index_path) as index_file:
+                archive.index = [
+                    json.loads(line) for line in index_file if line.strip()
+                ]
+        return archive
+
+    @property
+    def periods(self):
+        return self.run["periods"]
+
+    def add_period(self, from_date, to_date, config):
+        """Records a period of the run and the run settings it uses."""
+        with self.lock:
+            self.run["periods"].append(
+                {"from_date": from_date, "to_date": to_date, "config": config}
+            )
+            self._write_run()
+
+    def record(self, action, channel, from_date, to_date, page, data, source):
+        """
+        Appends a page of orders. source is "sellercloud" for a SellerCloud response and
+        "order_cache" for a day served by the order cache.
+        """
+        entry = {
+            "action": action,
+            "channel": channel,
+            "from_date": from_date,
+            "to_date": to_date,
+            "page": page,
+            "source": source,
+        }
+        member = gzip.compress(
+            (json.dumps({**entry, "response": data}) + "\n").encode(),
+            compresslevel=archive_config["compress_level"],
+        )
+        entry["orders"] = len(data.get("Items") or [])
+        entry["length"] = len(member)
+
+        with self.lock:
+            try:
+                with open(self.responses_path, "ab") as responses_file:
+                    entry["offset"] = responses_file.tell()
+                    responses_file.write(member)
+                with open(self.index_path, "a") as index_file:
+                    index_file.write(json.dumps(entry) + "\n")
+                self.index.append(entry)
+            except Exception as e:
+                # The run goes on without the page in its archive
+                print(f"Could not archive a SellerCloud page: {e}")
+
+    def finish(self, success, **run_info):
+        with self.lock:
+            self.run["finished_at"] = datetime.now().isoformat()
+            self.run["success"] = success
+            self.run["run"].update(run_info)
+            self._write_run()
+
+    def read(self, entry):
+        """Returns the archived response of an index entry."""
+        with open(self.responses_path, "rb") as responses_file:
+            responses_file.seek(entry["offset"])
+            member = responses_file.read(entry["length"])
+        return json.loads(gzip.decompress(member))["response"]
+
+    def iter_pages(self, action, channel, from_date, to_date):
+        """
+        Yields the archived pages of a channel between from_date and to_date, slimmed
+        like fetched pages, in window and page order. Orders are only yielded once.
+        """
+        date_format = "%m/%d/%Y %H:%M:%S"
+        first = datetime.strptime(from_date, date_format)
+        last = datetime.strptime(to_date, date_format)
+        entries = [
+            entry
+            for entry in self.index
+            if entry["action"] == action
+            and entry["channel"] == channel
+            and first <= datetime.strptime(entry["from_date"], date_format)
+            and datetime.strptime(entry["to_date"], date_format) <= last
+        ]
+        entries.sort(
+            key=lambda entry: (
+                datetime.strptime(entry["from_date"], date_format),
+                entry["page"],
+            )
+        )
+
+        seen = set()
+        for entry in entries:
+            page = []
+            for order in self.read(entry).get("Items") or []:
+                if order["ID"] not in seen:
+                    seen.add(order["ID"])
+                    page.append(slim_order(order))
+            if page:
+                yield page
+
+    def _write_run(self):
+        temporary_path = self.run_path.with_name(f".{self.run_path.name}.tmp")
+        temporary_path.write_text(json.dumps(self.run, indent=2, default=str))
+        temporary_path.replace(self.run_path)
@@ -1,8 +1,22 @@
 import requests
-from requests.exceptions import HTTPError, Timeout, RequestException
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout, RequestException
 from email_helper import send_email
 from urllib.parse import quote
-from config import sellercloud_credentials, sellercloud_endpoints
+from rate_limiter import RateLimiter
+from metrics import metrics
+from config import (
+    sellercloud_credentials,
+    sellercloud_endpoints,
+    sellercloud_url_args,
+    sellercloud_session,
+    sellercloud_concurrency,
+    sellercloud_channel_concurrency,
+    sellercloud_rate_limits,
+    sellercloud_retry_config,
+)
+import threading
+import time
 
 
 class SellerCloudAPI:
@@ -22,13 +36,64 @@ class SellerCloudAPI:
     def __init__(self):
         self.data = sellercloud_credentials
         self.endpoints = sellercloud_endpoints
-        response = self.execute(self.data, "GET_TOKEN")
-        self.token = response.json()["access_token"]
-        self.headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "Authorization": f"Bearer {self.token}",
-        }
+        self.session = self._create_session()
+        self.auth_lock = threading.RLock()
+        self.rate_limiter = RateLimiter(
+            sellercloud_rate_limits,
+            sellercloud_retry_config["target_latency_seconds"],
+            sellercloud_retry_config["backoff_seconds"],
+            sellercloud_retry_config["max_backoff_seconds"],
+        )
+        self.authenticate()
+
+    def authenticate(self):
+        """Gets a new access token and sets it on the session."""
+        with self.auth_lock:
+            response = self.execute(self.data, "GET_TOKEN")
+            token = response.json()
+            self.token = token["access_token"]
+            expires_in = (
+                token.get("expires_in") or sellercloud_session["token_ttl_seconds"]
+            )
+            self.token_expires_at = time.monotonic() + float(expires_in)
+            self.session.headers["Authorization"] = f"Bearer {self.token}"
+
+    def _reauthenticate(self, rejected_token):
+        """
+        Gets a new access token after rejected_token was refused, unless another
+        request already replaced it.
+        """
+        with self.auth_lock:
+            if self.token == rejected_token:
+                print("SellerCloud access token was rejected, authenticating again")
+                self.authenticate()
+
+    def token_expires_in(self):
+        """Returns the number of seconds left before the access token expires."""
+        return self.token_expires_at - time.monotonic()
+
+    def _create_session(self):
+        """Creates a keep-alive session shared by every request made by this class."""
+        session = requests.Session()
+        # Every channel fetched at the same time can have all its pages in flight
+        pool_size = max(
+            sellercloud_session["pool_size"],
+            max(sellercloud_concurrency.values()) * sellercloud_channel_concurrency,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=sellercloud_session["pool_connections"],
+            pool_maxsize=pool_size,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(
+            {
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip, deflate",
+            }
+        )
+        return session
 
     def execute(self, data, action):
         """Executes a request to the SellerCloud API.
@@ -47,10 +112,10 @@ class SellerCloudAPI:
             raise ValueError("Invalid API action")
 
         if action == "GET_TOKEN":
-            self.headers = None
-            return self.perform_request(self.data, **config)
+            self.session.headers.pop("Authorization", None)
+            return self.perform_request(self.data, action=action, **config)
 
-        return self.perform_request(data, **config)
+        return self.perform_request(data, action=action, **config)
 
     def perform_request(
         self,
@@ -59,47 +124,112 @@ class SellerCloudAPI:
         url,
         endpoint_error_message,
         success_message,
+        action=None,
     ):
-        """Performs a request to the SellerCloud API."""
+        """
+        Performs a request to the SellerCloud API.
+
+        Requests go through the shared rate limiter of their endpoint. Connection
+        errors, timeouts, 429 and 5xx responses are retried with an exponential backoff
+        with jitter, honouring Retry-After when SellerCloud sends it. A 401, e.g. when
+        the token expires during a long job, is retried once with a new token.
+        """
         error_message = None
-        max_attempts = 3
-        timeout = 1000
+        response = None
+        reauthenticated = action == "GET_TOKEN"
+        max_attempts = sellercloud_retry_config["max_attempts"]
+        timeout = (
+            sellercloud_retry_config["connect_timeout"],
+            sellercloud_retry_config["read_timeout"],
+        )
+        endpoint = action or url
+        limiter = self.rate_limiter.endpoint(endpoint)
 
-        for attempt in range(max_attempts):
-            try:
-                data_copy = data.copy()
-                url_args = data_copy.pop("url_args", None)
+        data_copy = data.copy()
+        url_args = data_copy.pop("url_args", None)
 
-                if url_args:
-                    formatted_url = self._sanitize_url(url, url_args)
-                else:
-                    formatted_url = url
+        if url_args:
+            formatted_url = self._sanitize_url(url, url_args)
+        else:
+            formatted_url = url
 
-                request_function = getattr(requests, type)
+        request_function = getattr(self.session, type)
 
-                response = request_function(
-                    formatted_url, headers=self.headers, json=data, timeout=timeout
-                )
-                break
-            except ConnectionError:
-                if attempt < max_attempts - 1:
-                    continue
-                else:
-                    error_message = (
-                        f"Connection error occurred {endpoint_error_message}"
+        for attempt in range(max_attempts):
+            if attempt:
+                limiter.count("retries")
+
+            retry_after = None
+            token = getattr(self, "token", None)
+            try:
+                limiter.count("throttle_wait_seconds", limiter.bucket.acquire())
+                with limiter.concurrency:
+                    limiter.count("requests")
+                    start = time.perf_counter()
+                    response = request_function(
+                        formatted_url, json=data, timeout=timeout
                     )
-            except HTTPError as http_err:
+                    latency = time.perf_counter() - start
+                metrics.observe(
+                    "sellercloud_request_seconds", latency, endpoint=endpoint
+                )
+                metrics.count(
+                    "sellercloud_requests",
+                    endpoint=endpoint,
+                    status=response.status_code,
+                )
+                metrics.count(
+                    "sellercloud_response_bytes",
+                    len(response.content),
+                    endpoint=endpoint,
+                )
+            except (ConnectionError, Timeout) as err:
+                limiter.count("connection_errors")
+                metrics.count("sellercloud_requests", endpoint=endpoint, status="error")
+                limiter.concurrency.record_failure()
+                response = None
                 error_message = (
-                    f"HTTP error occurred {endpoint_error_message}{http_err}"
+                    f"Connection error occurred {endpoint_error_message}{err}"
                 )
-            except Timeout:
-                error_message = f"Timeout occurred {endpoint_error_message}"
             except RequestException as err:
                 error_message = f"Other error occurred {endpoint_error_message}{err}"
+                break
             except Exception as e:
                 error_message = (
                     f"An unexpected error occurred {endpoint_error_message}{e}"
                 )
+                break
+            else:
+                if response.status_code == 429 or response.status_code >= 500:
+                    limiter.count(
+                        "throttled" if response.status_code == 429 else "server_errors"
+                    )
+                    limiter.concurrency.record_failure()
+                    retry_after = self.rate_limiter.parse_retry_after(
+                        response.headers.get("Retry-After")
+                    )
+                    error_message = None
+                elif response.status_code == 401 and not reauthenticated:
+                    limiter.count("reauthentications")
+                    reauthenticated = True
+                    try:
+                        self._reauthenticate(token)
+                    except Exception as e:
+                        error_message = (
+                            f"Could not authenticate again {endpoint_error_message}{e}"
+                        )
+                        break
+                    error_message = None
+                    continue
+                else:
+                    limiter.concurrency.record_success(latency)
+                    error_message = None
+                    break
+
+            if attempt < max_attempts - 1:
+                wait = self.rate_limiter.backoff(attempt, retry_after)
+                limiter.count("backoff_wait_seconds", wait)
+                time.sleep(wait)
 
         if error_message:
             print(error_message)
@@ -115,7 +245,15 @@ class SellerCloudAPI:
             print(success_message)
             return response
 
+    def get_request_stats(self):
+        """Returns the request, retry and throttling counters of every endpoint."""
+        return self.rate_limiter.stats()
+
     def _sanitize_url(self, url, url_args):
-        """Constructs a URL for a  API request."""
+        """
+        Constructs a URL for a  API request. The company placeholders are filled from
+        sellercloud_url_args unless url_args has them.
+        """
+        url_args = {**sellercloud_url_args, **url_args}
         sanitized_url_args = {k: quote(str(v)) for k, v in url_args.items()}
         return url.format(**sanitized_url_args)
@@ -0,0 +1,72 @@
+import math
+import threading
+from datetime import datetime, timedelta
+from config import sellercloud_sharding_config
+
+
+class ShardPlanner:
+    """
+    Splits large SellerCloud date ranges into day or hour windows.
+
+    Windows are sized from the order density, in orders per hour, last observed for an
+    endpoint and channel, so each one holds about window_pages pages. Every window is
+    paginated on its own, so a large range is fetched as several shallow page sequences
+    at the same time instead of one deep one.
+    """
+
+    date_format = "%m/%d/%Y %H:%M:%S"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.densities = {}
+
+    def density(self, key):
+        """Returns the last observed orders per hour for key, or None."""
+        with self.lock:
+            return self.densities.get(key)
+
+    def observe(self, key, from_date, to_date, orders):
+        """Records the number of orders found between from_date and to_date."""
+        density = orders / self._hours(from_date, to_date)
+        with self.lock:
+            self.densities[key] = density
+
+    def plan(self, from_date, to_date, page_size, density):
+        """
+        Returns the (from_date, to_date) windows covering the range, a single window
+        when it is expected to fit in max_pages pages. Consecutive windows share their
+        boundary second, orders shipped on it are returned by both.
+        """
+        hours = self._hours(from_date, to_date)
+        expected_pages = density * hours / page_size
+        if (
+            not sellercloud_sharding_config["enabled"]
+            or expected_pages <= sellercloud_sharding_config["max_pages"]
+        ):
+            return [(from_date, to_date)]
+
+        window_hours = sellercloud_sharding_config["window_pages"] * page_size / density
+        if window_hours >= 24:
+            step = timedelta(days=math.floor(window_hours / 24))
+        else:
+            step = timedelta(hours=max(1, math.floor(window_hours)))
+
+        start = datetime.strptime(from_date, self.date_format)
+        end = datetime.strptime(to_date, self.date_format)
+        windows = []
+        while start < end:
+            window_end = min(start + step, end)
+            windows.append(
+                (
+                    start.strftime(self.date_format),
+                    window_end.strftime(self.date_format),
+                )
+            )
+            start = window_end
+        return windows
+
+    def _hours(self, from_date, to_date):
+        start = datetime.strptime(from_date, self.date_format)
+        end = datetime.strptime(to_date, self.date_format)
+        # To dates end at :59:59, the range covers the whole last second
+        return max((end - start).total_seconds() + 1, 1) / 3600
@@ -0,0 +1,185 @@
+import json
+import multiprocessing
+import os
+import pathlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from email_helper import send_email, flush_emails
+import config
+
+# Settings a tenant profile can override, merged into the config dictionaries
+TENANT_SETTINGS = (
+    "sellercloud_credentials",
+    "sellercloud_url_args",
+    "client_data",
+    "ref_id_map",
+    "run_config",
+)
+
+
+def apply_tenant(profile):
+    """
+    Merges a tenant profile into the config dictionaries. The dictionaries are updated
+    in place so every module that imported them sees the tenant's settings. Only meant
+    for a process that runs a single tenant.
+    """
+    for setting in TENANT_SETTINGS:
+        getattr(config, setting).update(profile.get(setting, {}))
+
+    base_url = profile.get("sellercloud_base_url")
+    if base_url:
+        for endpoint in config.sellercloud_endpoints.values():
+            endpoint["url"] = endpoint["url"].replace(
+                config.sellercloud_base_url, base_url
+            )
+
+
+def run_tenant(
+    profile,
+    directory,
+    start_date=None,
+    end_date=None,
+    frequency="daily",
+    refresh_cache=False,
+):
+    """
+    Runs one tenant in the current process: yesterday's journal entries, or a backfill
+    from start_date to end_date when they are given, see main.backfill for
+    refresh_cache. The process works from the
+    tenant's directory, so reports, caches, metrics and emails are the tenant's own.
+    Returns a dictionary with the tenant name, status, period summaries and error.
+    """
+    result = {
+        "tenant": profile["name"],
+        "status": "failed",
+        "directory": str(directory),
+        "periods": [],
+        "error": None,
+    }
+    try:
+        pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+        os.chdir(directory)
+        apply_tenant(profile)
+
+        import main
+
+        if start_date:
+            result["periods"] = main.backfill(
+                start_date, end_date, frequency, refresh_cache=refresh_cache
+            )
+        else:
+            result["periods"] = main.main()
+        result["status"] = "ok"
+    except Exception:
+        result["error"] = traceback.format_exc()
+    finally:
+        # Pool workers exit without running atexit, the queued emails are sent here
+        flush_emails()
+    return result
+
+
+def run_tenants(
+    names=None, start_date=None, end_date=None, frequency="daily", refresh_cache=False
+):
+    """
+    Runs every tenant of tenant_config, or only the named ones, in parallel.
+
+    Each tenant runs in a fresh process, so no client, cache or setting is shared
+    between tenants. The results are written to report_path and emailed in a single
+    report. Returns the results in tenant order.
+    """
+    profiles = get_profiles(names)
+    root = pathlib.Path(config.tenant_config["directory"]).resolve()
+    print(f"Running {len(profiles)} tenants")
+
+    # spawn gives every tenant a clean interpreter, with its own config and clients
+    with ProcessPoolExecutor(
+        max_workers=config.tenant_config["max_workers"],
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=1,
+    ) as executor:
+        futures = [
+            executor.submit(
+                run_tenant,
+                profile,
+                root / profile["name"],
+                start_date,
+                end_date,
+                frequency,
+                refresh_cache,
+            )
+            for profile in profiles
+        ]
+        results = []
+        for profile, future in zip(profiles, futures):
+            try:
+                results.append(future.result())
+            except Exception:
+                # The worker process itself died
+                results.append(
+                    {
+                        "tenant": profile["name"],
+                        "status": "failed",
+                        "directory": str(root / profile["name"]),
+                        "periods": [],
+                        "error": traceback.format_exc(),
+                    }
+                )
+
+    report = format_report(results)
+    print(report)
+    write_report(results)
+    send_email("Tenant run finished", report)
+    return results
+
+
+def get_profiles(names=None):
+    profiles = config.tenant_config["tenants"]
+    if not names:
+        return profiles
+
+    unknown = set(names) - {profile["name"] for profile in profiles}
+    if unknown:
+        raise ValueError(f"Unknown tenants: {', '.join(sorted(unknown))}")
+    return [profile for profile in profiles if profile["name"] in names]
+
+
+def format_report(results):
+    """Formats one line per tenant and period."""
+    lines = []
+    for result in results:
+        if result["status"] != "ok":
+            error = (result["error"] or "").strip().splitlines()
+            lines.append(
+                f"ERROR {result['tenant']} | {error[-1] if error else 'unknown error'}"
+            )
+            continue
+
+        for period in result["periods"] or []:
+            channels = ", ".join(
+                f"{channel}: {data['orders']} orders {data['amount']}"
+                for channel, data in period["channels"].items()
+            )
+            journals = ", ".join(period["journals_created"])
+            status = "ERROR" if period.get("error") else "OK"
+            lines.append(
+                f"{status} {result['tenant']} {period['from_date']} - {period['to_date']} | "
+                f"{channels or 'no orders'} | journals: {journals or 'none'}"
+            )
+    return "\n".join(lines)
+
+
+def write_report(results):
+    path = pathlib.Path(config.tenant_config["report_path"])
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(
+                {"finished_at": datetime.now().isoformat(), "tenants": results},
+                indent=2,
+                default=str,
+            )
+        )
+    except Exception as e:
+        print(f"Could not write the tenant run report: {e}")
@@ -0,0 +1,85 @@
+import os
+import unittest
+
+# The QuickBooks client refuses plain http without this
+os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+
+import config
+from benchmarks.bench_pipeline import FakeAuthClient
+from benchmarks.fake_servers import FakeQuickBooks
+from qb_api import QbAPI
+
+
+class BatchJournalEntriesTest(unittest.TestCase):
+    """
+    Creates channel journal entries through the batch endpoint of the fake QuickBooks
+    server, with more entries than fit in one batch request and one of them refused
+    with a Fault.
+    """
+
+    to_date = "07/01/2024 23:59:59"
+    failing_doc_number = "WH_COG_07012024_SC"
+    entries = [
+        (12345, "DF", to_date),
+        (-500, "DF", to_date, "DF_COG_07012024_SCA1"),
+        (67890, "WH", to_date),
+        (2500, "VN", to_date),
+        (100, "VN", to_date, "VN_COG_07012024_SCA1"),
+    ]
+
+    def setUp(self):
+        self.quick_books = FakeQuickBooks(
+            failing_doc_numbers=[self.failing_doc_number]
+        ).start()
+        self.addCleanup(self.quick_books.stop)
+        self.client_data = dict(config.client_data)
+        self.persist = config.qb_ref_cache_config["persist"]
+        self.max_items = config.qb_batch_config["max_items"]
+        config.client_data["api_url"] = f"{self.quick_books.url}/v3"
+        config.qb_ref_cache_config["persist"] = False
+        config.qb_batch_config["max_items"] = 2
+
+    def tearDown(self):
+        config.client_data.clear()
+        config.client_data.update(self.client_data)
+        config.qb_ref_cache_config["persist"] = self.persist
+        config.qb_batch_config["max_items"] = self.max_items
+
+    def test_chunks_and_faults(self):
+        qb_api = QbAPI("fake-refresh-token", auth_client=FakeAuthClient())
+        results = qb_api.batch_create_journal_entries(self.entries)
+
+        self.assertEqual(
+            self.quick_books.batches,
+            [
+                ["DF_COG_07012024_SC", "DF_COG_07012024_SCA1"],
+                ["WH_COG_07012024_SC", "VN_COG_07012024_SC"],
+                ["VN_COG_07012024_SCA1"],
+            ],
+        )
+
+        failed = results[self.failing_doc_number]
+        self.assertEqual(failed["status"], "failed")
+        self.assertEqual(failed["channel"], "WH")
+        self.assertIsNone(failed["id"])
+        self.assertIn("Duplicate Document Number Error", failed["error"])
+        self.assertFalse(qb_api.get_journal_entry_id(self.failing_doc_number))
+
+        created = {
+            doc_number: result
+            for doc_number, result in results.items()
+            if doc_number != self.failing_doc_number
+        }
+        self.assertEqual(len(created), 4)
+        for doc_number, result in created.items():
+            self.assertEqual(result["status"], "created")
+            self.assertIsNone(result["error"])
+            self.assertEqual(qb_api.get_journal_entry_id(doc_number), result["id"])
+        self.assertEqual(
+            [result["channel"] for result in created.values()],
+            ["DF", "DF", "VN", "VN"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import random
+import unittest
+from decimal import Decimal, ROUND_HALF_UP
+
+from decimal_rounding import subcents_to_cents
+from helpers import Helpers
+
+
+def baseline_cents(orders):
+    """The channel amount of the original script: float line sums rounded once."""
+    total = 0
+    for order in orders:
+        for item in order["Items"]:
+            total += item["AverageCost"] * item["Qty"]
+    rounded = Decimal(str(total)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return int(rounded * 100)
+
+
+def make_order(order_id, items):
+    return {
+        "ID": order_id,
+        "OrderSourceOrderID": f"PO{order_id}",
+        "ShipDate": "2024-07-01T10:00:00",
+        "Items": [
+            {"ProductIDOriginal": f"SKU{index}", "AverageCost": cost, "Qty": qty}
+            for index, (cost, qty) in enumerate(items)
+        ],
+    }
+
+
+class ChannelAmountsTest(unittest.TestCase):
+    """
+    The posted channel amount has to match the baseline rounding and the total_cost
+    column of the attached report, also for costs with more than 4 decimals.
+    """
+
+    def assert_matches_baseline(self, orders):
+        frame, amount_subcents = Helpers().build_cost_frame(orders, {})
+        cents = subcents_to_cents(amount_subcents)
+        self.assertEqual(cents, baseline_cents(orders))
+        report_total = Decimal(str(frame["total_cost"].sum())).quantize(
+            Decimal("0.01"), rounding=ROUND_HALF_UP
+        )
+        self.assertEqual(cents, int(report_total * 100))
+
+    def test_cost_with_five_decimals(self):
+        orders = [make_order(1, [(1.23456, 1000)])]
+        frame, amount_subcents = Helpers().build_cost_frame(orders, {})
+        self.assertEqual(subcents_to_cents(amount_subcents), 123456)
+        self.assertEqual(baseline_cents(orders), 123456)
+
+    def test_costs_with_many_decimals(self):
+        orders = [
+            make_order(1, [(0.333333, 3), (12.98765, 7)]),
+            make_order(2, [(4.99999, 250), (0.00005, 1), (7.125, 2)]),
+        ]
+        self.assert_matches_baseline(orders)
+
+    def test_random_costs(self):
+        generator = random.Random(1234)
+        for _ in range(200):
+            orders = [
+                make_order(
+                    order_id,
+                    [
+                        (
+                            round(generator.uniform(0, 200), generator.randint(2, 6)),
+                            generator.randint(1, 500),
+                        )
+                        for _ in range(generator.randint(1, 5))
+                    ],
+                )
+                for order_id in range(generator.randint(1, 20))
+            ]
+            self.assert_matches_baseline(orders)
+
+
+if __name__ == "__main__":
+    unittest.main()
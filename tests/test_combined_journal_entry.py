@@ -0,0 +1,63 @@
+import os
+import unittest
+
+# The QuickBooks client refuses plain http without this
+os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+
+import config
+from benchmarks.bench_pipeline import FakeAuthClient
+from benchmarks.fake_servers import FakeQuickBooks
+from qb_api import QbAPI, DryRunQbAPI
+
+
+class CombinedJournalEntryTest(unittest.TestCase):
+    """
+    Runs the combined journal entry through QbAPI, against the fake QuickBooks
+    server, and through DryRunQbAPI, with the to_date process_period passes in, so
+    replays create the same entry as real runs.
+    """
+
+    to_date = "07/01/2024 23:59:59"
+    channel_amounts_and_report = {
+        "DF": {"channel_cents": 12345},
+        "WH": {"channel_cents": 67890},
+    }
+
+    def setUp(self):
+        self.quick_books = FakeQuickBooks().start()
+        self.addCleanup(self.quick_books.stop)
+        self.client_data = dict(config.client_data)
+        self.persist = config.qb_ref_cache_config["persist"]
+        config.client_data["api_url"] = f"{self.quick_books.url}/v3"
+        config.qb_ref_cache_config["persist"] = False
+
+    def tearDown(self):
+        config.client_data.clear()
+        config.client_data.update(self.client_data)
+        config.qb_ref_cache_config["persist"] = self.persist
+
+    def test_real_and_dry_run_create_the_same_entry(self):
+        qb_api = QbAPI("fake-refresh-token", auth_client=FakeAuthClient())
+        doc_number = qb_api.create_combined_journal_entry(
+            self.channel_amounts_and_report, self.to_date
+        )
+
+        dry_run = DryRunQbAPI()
+        dry_run_doc_number = dry_run.create_combined_journal_entry(
+            self.channel_amounts_and_report, self.to_date
+        )
+
+        self.assertEqual(doc_number, "COG_JUL01_SC")
+        self.assertEqual(dry_run_doc_number, doc_number)
+        self.assertTrue(qb_api.get_journal_entry_id(doc_number))
+
+        (journal_entry,) = self.quick_books.journal_entries
+        self.assertEqual(journal_entry["DocNumber"], doc_number)
+        self.assertEqual(journal_entry["TxnDate"], "2024-07-01")
+        amounts = [line["Amount"] for line in journal_entry["Line"]]
+        self.assertEqual(amounts, [802.35, 123.45, 678.9])
+        self.assertEqual(dry_run.entries[0]["amounts"], {"DF": 123.45, "WH": 678.9})
+
+
+if __name__ == "__main__":
+    unittest.main()
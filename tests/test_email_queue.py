@@ -0,0 +1,115 @@
+import os
+import subprocess
+import sys
+import textwrap
+import unittest
+
+from benchmarks.fake_servers import FakeSmtp
+from config import email_config
+from email_helper import EmailQueue
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class EmailQueueTest(unittest.TestCase):
+    """Sends emails through EmailQueue to the fake SMTP server."""
+
+    def setUp(self):
+        self.smtp = FakeSmtp().start()
+        self.addCleanup(self.smtp.stop)
+        self.email_config = dict(email_config)
+        email_config.update(
+            {
+                "smtp_host": self.smtp.host,
+                "smtp_port": self.smtp.port,
+                "use_ssl": False,
+                "login": False,
+                "coalesce_seconds": 30,
+                "max_digest_messages": 20,
+            }
+        )
+        self.folder_name = os.path.basename(os.getcwd())
+
+    def tearDown(self):
+        email_config.update(self.email_config)
+
+    def messages(self):
+        """Returns the body of every message received, by subject."""
+        return {
+            message["Subject"]: message.get_payload().replace("\r\n", "\n")
+            for message in self.smtp.messages
+        }
+
+    def test_digest_in_one_session_per_flush(self):
+        email_queue = EmailQueue()
+        for _ in range(3):
+            email_queue.put("Request failed", "Timeout on page 2")
+        email_queue.put("Request failed", "Status 500 on page 3")
+        email_queue.put("Backfill summary", "31 days")
+        # Sent on flush, long before the coalescing window ends
+        self.assertTrue(email_queue.flush(timeout=10))
+
+        self.assertEqual(self.smtp.sessions, 1)
+        messages = self.messages()
+        self.assertEqual(
+            sorted(messages),
+            [
+                f"Backfill summary : {self.folder_name}",
+                f"Request failed (4 times) : {self.folder_name}",
+            ],
+        )
+        digest = messages[f"Request failed (4 times) : {self.folder_name}"]
+        self.assertIn("3 times:\nTimeout on page 2\n\nStatus 500 on page 3", digest)
+        self.assertTrue(
+            messages[f"Backfill summary : {self.folder_name}"].startswith("31 days\n")
+        )
+
+        email_queue.put("Request failed", "Timeout on page 4")
+        self.assertTrue(email_queue.flush(timeout=10))
+        self.assertEqual(self.smtp.sessions, 2)
+        self.assertEqual(len(self.smtp.messages), 3)
+        self.assertEqual(
+            self.smtp.messages[-1]["Subject"], f"Request failed : {self.folder_name}"
+        )
+
+    def test_digest_is_capped(self):
+        email_config["max_digest_messages"] = 2
+        email_queue = EmailQueue()
+        for page in range(5):
+            email_queue.put("Request failed", f"Timeout on page {page}")
+        self.assertTrue(email_queue.flush(timeout=10))
+
+        (digest,) = self.messages().values()
+        self.assertIn("Timeout on page 1", digest)
+        self.assertNotIn("Timeout on page 2", digest)
+        self.assertIn("... and 3 other messages", digest)
+
+    def test_flush_without_emails(self):
+        self.assertTrue(EmailQueue().flush(timeout=1))
+        self.assertEqual(self.smtp.sessions, 0)
+
+    def test_queued_emails_are_sent_at_exit(self):
+        script = textwrap.dedent(f"""
+            from config import email_config
+            from email_helper import send_email
+
+            email_config.update(
+                smtp_host={self.smtp.host!r},
+                smtp_port={self.smtp.port},
+                use_ssl=False,
+                login=False,
+                coalesce_seconds=30,
+            )
+            send_email("Job failed", "first")
+            send_email("Job failed", "second")
+            """)
+        subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True, timeout=20)
+
+        self.assertEqual(self.smtp.sessions, 1)
+        folder_name = os.path.basename(ROOT)
+        digest = self.messages()[f"Job failed (2 times) : {folder_name}"]
+        self.assertIn("first\n\nsecond", digest)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+import os
+import tempfile
+import unittest
+
+# The QuickBooks client refuses plain http without this
+os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+
+import config
+import main
+from benchmarks.bench_pipeline import FakeAuthClient
+from benchmarks.fake_servers import FakeQuickBooks, FakeSellerCloud
+from helpers import Helpers
+from ledger import Ledger
+from qb_api import QbAPI
+from seller_cloud_api import SellerCloudAPI
+
+
+class FakeServersTestCase(unittest.TestCase):
+    """Points the clients at the fake servers and works in a temporary directory."""
+
+    to_date = "07/01/2024 23:59:59"
+    base_doc_number = "DF_COG_07012024_SC"
+
+    def setUp(self):
+        self.seller_cloud = FakeSellerCloud(orders_per_channel=10).start()
+        self.addCleanup(self.seller_cloud.stop)
+        self.quick_books = FakeQuickBooks().start()
+        self.addCleanup(self.quick_books.stop)
+
+        self.client_data = dict(config.client_data)
+        self.persist = config.qb_ref_cache_config["persist"]
+        self.email_enabled = config.EMAIL_ENABLED
+        self.urls = {
+            action: endpoint["url"]
+            for action, endpoint in config.sellercloud_endpoints.items()
+        }
+        config.client_data["api_url"] = f"{self.quick_books.url}/v3"
+        config.qb_ref_cache_config["persist"] = False
+        config.EMAIL_ENABLED = False
+        for endpoint in config.sellercloud_endpoints.values():
+            endpoint["url"] = endpoint["url"].replace(
+                config.sellercloud_base_url, f"{self.seller_cloud.url}/rest/api/"
+            )
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cwd = os.getcwd()
+        os.chdir(directory.name)
+        self.addCleanup(os.chdir, cwd)
+
+        self.ledger = Ledger("ledger.sqlite3")
+        self.qb_api = QbAPI("fake-refresh-token", auth_client=FakeAuthClient())
+
+    def tearDown(self):
+        config.client_data.clear()
+        config.client_data.update(self.client_data)
+        config.qb_ref_cache_config["persist"] = self.persist
+        config.EMAIL_ENABLED = self.email_enabled
+        for action, url in self.urls.items():
+            config.sellercloud_endpoints[action]["url"] = url
+
+    def posting_types(self, journal_entry):
+        """Returns the PostingType of the credit and cost lines of a journal entry."""
+        return [
+            line["JournalEntryLineDetail"]["PostingType"]
+            for line in journal_entry["Line"]
+        ]
+
+
+class PlanPostingsTest(FakeServersTestCase):
+    """Runs plan_postings on given channel reports against the fake QuickBooks."""
+
+    def test_new_period_posts_the_base_entry(self):
+        reports = {"DF": {"channel_cents": 250, "order_subcents": {1: 2500000}}}
+        to_post = main.plan_postings(self.ledger, self.qb_api, reports, self.to_date)
+
+        self.assertEqual(
+            to_post,
+            {
+                self.base_doc_number: {
+                    "channel": "DF",
+                    "cents": 250,
+                    "base_doc_number": self.base_doc_number,
+                }
+            },
+        )
+
+    def test_seeds_the_ledger_from_the_quickbooks_total(self):
+        # Posted by a run before the ledger existed
+        self.quick_books.journal_entries.append(
+            {"Id": "77", "DocNumber": self.base_doc_number, "TotalAmt": 1.5}
+        )
+        reports = {
+            "DF": {"channel_cents": 200, "order_subcents": {1: 1500000, 2: 500000}}
+        }
+        to_post = main.plan_postings(self.ledger, self.qb_api, reports, self.to_date)
+
+        self.assertEqual(
+            to_post,
+            {
+                f"{self.base_doc_number}A1": {
+                    "channel": "DF",
+                    "cents": 50,
+                    "base_doc_number": self.base_doc_number,
+                }
+            },
+        )
+        self.assertEqual(self.ledger.posted_cents(self.base_doc_number), 150)
+        # The orders are only recorded with the adjustment
+        self.assertEqual(self.ledger.posted_orders(self.base_doc_number), {})
+
+    def test_seeded_total_without_difference(self):
+        self.quick_books.journal_entries.append(
+            {"Id": "77", "DocNumber": self.base_doc_number, "TotalAmt": 2.0}
+        )
+        order_subcents = {1: 1500000, 2: 500000}
+        reports = {"DF": {"channel_cents": 200, "order_subcents": order_subcents}}
+        to_post = main.plan_postings(self.ledger, self.qb_api, reports, self.to_date)
+
+        self.assertEqual(to_post, {})
+        self.assertEqual(self.ledger.posted_cents(self.base_doc_number), 200)
+        self.assertEqual(
+            self.ledger.posted_orders(self.base_doc_number), order_subcents
+        )
+
+    def test_changed_orders_with_the_same_total(self):
+        self.ledger.record(
+            self.base_doc_number,
+            self.base_doc_number,
+            "DF",
+            self.to_date,
+            200,
+            "77",
+            {1: 1500000, 2: 500000},
+        )
+        order_subcents = {1: 1000000, 3: 1000000}
+        reports = {"DF": {"channel_cents": 200, "order_subcents": order_subcents}}
+        to_post = main.plan_postings(self.ledger, self.qb_api, reports, self.to_date)
+
+        self.assertEqual(to_post, {})
+        self.assertEqual(self.ledger.posted_cents(self.base_doc_number), 200)
+        self.assertEqual(
+            self.ledger.posted_orders(self.base_doc_number), order_subcents
+        )
+        self.assertEqual(self.quick_books.journal_entries, [])
+
+
+class ReconcilePeriodTest(FakeServersTestCase):
+    """
+    Runs the same period several times through process_period while the orders of the
+    fake SellerCloud change, and checks the entries posted to the fake QuickBooks.
+    """
+
+    run_config = {
+        **config.run_config,
+        "run_DF": True,
+        "run_WH": False,
+        "run_VN": False,
+        "run_combined": False,
+        "run_individual": True,
+        "post_in_batch": False,
+    }
+
+    def run_period(self, orders):
+        self.seller_cloud.orders_per_channel = orders
+        summary = main.process_period(
+            Helpers(ledger=self.ledger),
+            self.sc_api,
+            lambda: self.qb_api,
+            "07/01/2024 00:00:00",
+            self.to_date,
+            self.run_config,
+            notify=False,
+        )
+        return summary
+
+    def setUp(self):
+        super().setUp()
+        self.sc_api = SellerCloudAPI()
+
+    def test_adjustments_and_reversal(self):
+        summary = self.run_period(10)
+        self.assertEqual(summary["journals_created"], [self.base_doc_number])
+        cents = round(summary["channels"]["DF"]["amount"] * 100)
+        self.assertEqual(self.ledger.posted_cents(self.base_doc_number), cents)
+
+        # Nothing changed
+        self.assertEqual(self.run_period(10)["journals_created"], [])
+
+        # Fewer orders, the difference is posted with the sides swapped
+        summary = self.run_period(5)
+        self.assertEqual(summary["journals_created"], [f"{self.base_doc_number}A1"])
+        lower_cents = round(summary["channels"]["DF"]["amount"] * 100)
+        journal_entry = self.quick_books.journal_entries[-1]
+        self.assertEqual(journal_entry["TotalAmt"], (cents - lower_cents) / 100)
+        self.assertEqual(self.posting_types(journal_entry), ["Debit", "Credit"])
+        self.assertEqual(self.ledger.posted_cents(self.base_doc_number), lower_cents)
+
+        # More orders again
+        summary = self.run_period(8)
+        self.assertEqual(summary["journals_created"], [f"{self.base_doc_number}A2"])
+        higher_cents = round(summary["channels"]["DF"]["amount"] * 100)
+        journal_entry = self.quick_books.journal_entries[-1]
+        self.assertEqual(journal_entry["TotalAmt"], (higher_cents - lower_cents) / 100)
+        self.assertEqual(self.posting_types(journal_entry), ["Credit", "Debit"])
+
+        # Every order is gone, what was posted is reversed
+        summary = self.run_period(0)
+        self.assertEqual(summary["journals_created"], [f"{self.base_doc_number}A3"])
+        self.assertEqual(summary["channels"]["DF"], {"orders": 0, "amount": 0.0})
+        journal_entry = self.quick_books.journal_entries[-1]
+        self.assertEqual(journal_entry["TotalAmt"], higher_cents / 100)
+        self.assertEqual(self.posting_types(journal_entry), ["Debit", "Credit"])
+        self.assertEqual(self.ledger.posted_cents(self.base_doc_number), 0)
+        self.assertEqual(self.ledger.posted_orders(self.base_doc_number), {})
+
+        # Still no orders, nothing left to reverse
+        self.assertEqual(self.run_period(0)["journals_created"], [])
+        self.assertEqual(len(self.quick_books.journal_entries), 4)
+
+    def test_summary_in_channel_order(self):
+        self.seller_cloud.orders_per_channel = 10
+        summary = main.process_period(
+            Helpers(ledger=self.ledger),
+            self.sc_api,
+            lambda: self.qb_api,
+            "07/01/2024 00:00:00",
+            self.to_date,
+            {**self.run_config, "run_WH": True, "run_VN": True},
+            notify=False,
+        )
+
+        self.assertEqual(list(summary["channels"]), ["DF", "WH", "VN"])
+        self.assertEqual(
+            summary["journals_created"],
+            ["DF_COG_07012024_SC", "WH_COG_07012024_SC", "VN_COG_07012024_SC"],
+        )
+
+    def test_period_never_posted_without_orders(self):
+        summary = self.run_period(0)
+        self.assertEqual(summary["channels"], {})
+        self.assertEqual(summary["journals_created"], [])
+        self.assertEqual(self.quick_books.journal_entries, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest import mock
+
+import config
+from benchmarks.fake_servers import FakeSellerCloud
+from rate_limiter import RateLimiter
+from seller_cloud_api import SellerCloudAPI
+
+
+class SellerCloudRetriesTest(unittest.TestCase):
+    """
+    Runs SellerCloudAPI.perform_request against the fake SellerCloud server answering
+    with 429, 5xx or 401 responses first. The backoff sleeps are recorded instead of
+    slept.
+    """
+
+    action = "GET_SELLERCLOUD_ORDERS"
+    data = {
+        "url_args": {
+            "from": "07/01/2024 00:00:00",
+            "to": "07/01/2024 23:59:59",
+            "channel": 1,
+            "page": 1,
+            "page_size": 10,
+        }
+    }
+
+    def setUp(self):
+        self.seller_cloud = FakeSellerCloud(orders_per_channel=5).start()
+        self.addCleanup(self.seller_cloud.stop)
+        self.urls = {
+            action: endpoint["url"]
+            for action, endpoint in config.sellercloud_endpoints.items()
+        }
+        for endpoint in config.sellercloud_endpoints.values():
+            endpoint["url"] = endpoint["url"].replace(
+                config.sellercloud_base_url, f"{self.seller_cloud.url}/rest/api/"
+            )
+        self.email_enabled = config.EMAIL_ENABLED
+        config.EMAIL_ENABLED = False
+        self.api = SellerCloudAPI()
+
+    def tearDown(self):
+        for action, url in self.urls.items():
+            config.sellercloud_endpoints[action]["url"] = url
+        config.EMAIL_ENABLED = self.email_enabled
+
+    def execute(self):
+        """Executes the orders request and returns the response and the waits."""
+        waits = []
+        with mock.patch.object(time, "sleep", waits.append):
+            response = self.api.execute(self.data, self.action)
+        return response, waits
+
+    def stats(self):
+        return self.api.get_request_stats()[self.action]
+
+    def test_retries_throttling_and_server_errors(self):
+        self.seller_cloud.errors += [(429, {}), (503, {}), (500, {})]
+        response, waits = self.execute()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["Items"]), 5)
+        self.assertEqual(len(waits), 3)
+        stats = self.stats()
+        self.assertEqual(stats["requests"], 4)
+        self.assertEqual(stats["retries"], 3)
+        self.assertEqual(stats["throttled"], 1)
+        self.assertEqual(stats["server_errors"], 2)
+        self.assertEqual(stats["connection_errors"], 0)
+        self.assertAlmostEqual(stats["backoff_wait_seconds"], sum(waits))
+
+    def test_gives_up_after_max_attempts(self):
+        max_attempts = config.sellercloud_retry_config["max_attempts"]
+        self.seller_cloud.errors += [(502, {})] * (max_attempts + 1)
+        response, waits = self.execute()
+
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(len(waits), max_attempts - 1)
+        stats = self.stats()
+        self.assertEqual(stats["requests"], max_attempts)
+        self.assertEqual(stats["retries"], max_attempts - 1)
+        self.assertEqual(stats["server_errors"], max_attempts)
+
+    def test_retry_after_seconds(self):
+        self.seller_cloud.errors += [
+            (429, {"Retry-After": "7"}),
+            (429, {"Retry-After": "600"}),
+        ]
+        response, waits = self.execute()
+
+        self.assertEqual(response.status_code, 200)
+        max_backoff = config.sellercloud_retry_config["max_backoff_seconds"]
+        self.assertEqual(waits, [7.0, max_backoff])
+        self.assertEqual(self.stats()["backoff_wait_seconds"], 7.0 + max_backoff)
+
+    def test_retry_after_http_date(self):
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+        self.seller_cloud.errors.append(
+            (503, {"Retry-After": format_datetime(retry_at, usegmt=True)})
+        )
+        response, (wait,) = self.execute()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(25 <= wait <= 30, wait)
+
+    def test_reauthenticates_once_on_401(self):
+        self.seller_cloud.errors.append((401, {}))
+        response, waits = self.execute()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(waits, [])
+        self.assertEqual(self.seller_cloud.tokens_issued, 2)
+        self.assertEqual(self.api.token, "fake-token-2")
+        self.assertEqual(self.stats()["reauthentications"], 1)
+
+    def test_second_401_is_final(self):
+        self.seller_cloud.errors += [(401, {}), (401, {})]
+        response, waits = self.execute()
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.seller_cloud.tokens_issued, 2)
+        self.assertEqual(self.stats()["requests"], 2)
+        self.assertEqual(self.stats()["reauthentications"], 1)
+
+
+class RateLimiterBackoffTest(unittest.TestCase):
+    """Checks the backoff ceiling and the parsing of Retry-After headers."""
+
+    def setUp(self):
+        self.rate_limiter = RateLimiter(
+            {"default": {"requests_per_second": 5, "burst": 5, "max_concurrency": 4}},
+            target_latency=10,
+            backoff_seconds=1,
+            max_backoff_seconds=60,
+        )
+
+    def test_backoff_ceiling(self):
+        with mock.patch("rate_limiter.random.uniform", lambda low, high: high):
+            ceilings = [self.rate_limiter.backoff(attempt) for attempt in range(10)]
+        self.assertEqual(ceilings, [1, 2, 4, 8, 16, 32, 60, 60, 60, 60])
+        for attempt in range(10):
+            self.assertTrue(0 <= self.rate_limiter.backoff(attempt) <= 60)
+
+    def test_retry_after_is_capped(self):
+        self.assertEqual(self.rate_limiter.backoff(0, retry_after=5.5), 5.5)
+        self.assertEqual(self.rate_limiter.backoff(0, retry_after=3600), 60)
+
+    def test_parse_retry_after(self):
+        parse = self.rate_limiter.parse_retry_after
+        self.assertEqual(parse("12"), 12.0)
+        self.assertEqual(parse("-3"), 0.0)
+        self.assertIsNone(parse(None))
+        self.assertIsNone(parse("soon"))
+        self.assertEqual(parse("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=90)
+        self.assertAlmostEqual(
+            parse(format_datetime(retry_at, usegmt=True)), 90, delta=2
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+
+import config
+from benchmarks.fake_servers import FakeSellerCloud
+from helpers import Helpers
+from metrics import metrics
+from order_cache import OrderCache
+from seller_cloud_api import SellerCloudAPI
+
+
+class ShardedFetchTest(unittest.TestCase):
+    """
+    Fetches the same range from the fake SellerCloud server with and without sharding
+    and compares the orders. Hour windows share their boundary second, so the orders
+    the fake ships at 12:00:00 are returned by two windows.
+    """
+
+    action = "GET_SELLERCLOUD_ORDERS"
+    channel = 66
+    orders = 1000
+    # The fake ships order n at (n % 24):(n % 60):00, so at 12:00:00 for every n
+    # below orders with n % 120 == 60
+    boundary_orders = len(range(60, orders, FakeSellerCloud.SHIP_TIME_CYCLE))
+    from_date = "07/01/2024 00:00:00"
+    to_date = "07/01/2024 23:59:59"
+
+    def setUp(self):
+        self.seller_cloud = FakeSellerCloud(orders_per_channel=self.orders).start()
+        self.addCleanup(self.seller_cloud.stop)
+        self.urls = {
+            action: endpoint["url"]
+            for action, endpoint in config.sellercloud_endpoints.items()
+        }
+        for endpoint in config.sellercloud_endpoints.values():
+            endpoint["url"] = endpoint["url"].replace(
+                config.sellercloud_base_url, f"{self.seller_cloud.url}/rest/api/"
+            )
+        self.sharding_config = dict(config.sellercloud_sharding_config)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.sc_api = SellerCloudAPI()
+        metrics.reset()
+
+    def tearDown(self):
+        for action, url in self.urls.items():
+            config.sellercloud_endpoints[action]["url"] = url
+        config.sellercloud_sharding_config.clear()
+        config.sellercloud_sharding_config.update(self.sharding_config)
+
+    def fetch(self, h, sharded, from_date=None, to_date=None):
+        """Returns the orders of the range, fetched with or without sharding."""
+        # 20 pages of 50 orders, split in one hour windows when sharded
+        config.sellercloud_sharding_config.update(
+            enabled=sharded, max_pages=2, window_pages=1
+        )
+        pages = h.iter_sc_order_pages(
+            from_date or self.from_date,
+            to_date or self.to_date,
+            self.channel,
+            self.sc_api,
+            channel_name="DF",
+        )
+        return [order for page in pages for order in page]
+
+    def order_amounts(self, orders):
+        """Returns the cost of every order, by ID, and checks no order repeats."""
+        order_ids = [order["ID"] for order in orders]
+        self.assertEqual(len(order_ids), len(set(order_ids)))
+        order_subcents = {}
+        Helpers().build_cost_frame(orders, {}, order_subcents)
+        return order_subcents
+
+    def counter(self, name):
+        counters = metrics.summary()["counters"].get(name, [])
+        return sum(counter["value"] for counter in counters)
+
+    def test_range_with_probe_page(self):
+        unsharded = self.order_amounts(self.fetch(Helpers(), sharded=False))
+        self.assertEqual(self.counter("sellercloud_windows"), 0)
+
+        # The first page of the whole range is fetched to measure the density, then
+        # the same orders come again with the first windows
+        sharded = self.order_amounts(self.fetch(Helpers(), sharded=True))
+        self.assertEqual(self.counter("sellercloud_windows"), 24)
+        self.assertEqual(len(unsharded), self.orders)
+        self.assertEqual(sharded, unsharded)
+        # The 50 orders of the probe page and the ones shipped on the 12:00:00 boundary
+        self.assertEqual(self.counter("duplicate_orders"), 50 + self.boundary_orders)
+
+    def test_known_density(self):
+        h = Helpers()
+        h.shard_planner.observe(
+            (self.action, self.channel), self.from_date, self.to_date, self.orders
+        )
+        sharded = self.order_amounts(self.fetch(h, sharded=True))
+        unsharded = self.order_amounts(self.fetch(Helpers(), sharded=False))
+
+        self.assertEqual(self.counter("sellercloud_windows"), 24)
+        self.assertEqual(sharded, unsharded)
+        self.assertEqual(self.counter("duplicate_orders"), self.boundary_orders)
+
+    def test_cached_days(self):
+        from_date, to_date = "06/30/2024 00:00:00", "07/02/2024 23:59:59"
+        h = Helpers(order_cache=OrderCache(os.path.join(self.directory, "a.sqlite3")))
+        h.shard_planner.observe(
+            (self.action, self.channel), self.from_date, self.to_date, self.orders
+        )
+        sharded = self.order_amounts(self.fetch(h, True, from_date, to_date))
+        unsharded = self.order_amounts(
+            self.fetch(
+                Helpers(
+                    order_cache=OrderCache(os.path.join(self.directory, "b.sqlite3"))
+                ),
+                False,
+                from_date,
+                to_date,
+            )
+        )
+
+        self.assertEqual(len(unsharded), self.orders)
+        self.assertEqual(sharded, unsharded)
+        self.assertEqual(self.counter("duplicate_orders"), self.boundary_orders)
+        # Served from the cache the second time
+        self.assertEqual(
+            self.order_amounts(self.fetch(h, True, from_date, to_date)), sharded
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()